@@ -1,17 +1,122 @@
+import os
+import time
+
 import redis
-import json
-
-redis_host="localhost"
-redis_port=6379
-
-
-redis_client=redis.StrictRedis(host=redis_host, port=redis_port, decode_responses=True)
-def add_to_redis(key, value):
-    print(type(value))
-    print(value)
-    redis_client.set(key, value)
-def get_from_redis(key):
-    value = redis_client.get(key)
-    if value is not None:
-        return value
-    return None
\ No newline at end of file
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD") or None
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+# prefix for every key this app writes; empty keeps the historical flat keys
+REDIS_NAMESPACE = os.getenv("REDIS_NAMESPACE", "")
+REDIS_BATCH_SIZE = int(os.getenv("REDIS_BATCH_SIZE", "500"))
+
+pool = redis.ConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    password=REDIS_PASSWORD,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    decode_responses=True,
+)
+redis_client = redis.StrictRedis(connection_pool=pool)
+# same server, raw bytes in and out, for packed vectors and other binary fields
+binary_pool = redis.ConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    password=REDIS_PASSWORD,
+    max_connections=REDIS_MAX_CONNECTIONS,
+)
+binary_client = redis.StrictRedis(connection_pool=binary_pool)
+
+
+def key(*parts):
+    return ":".join(([REDIS_NAMESPACE] if REDIS_NAMESPACE else []) + [str(part) for part in parts])
+
+
+def glob_escape(text):
+    return "".join("\\" + c if c in "*?[]\\" else c for c in text)
+
+
+def scan_keys(pattern="*", count=REDIS_BATCH_SIZE):
+    # incremental SCAN over this namespace; never KEYS, which blocks the server
+    return redis_client.scan_iter(match=key(pattern), count=count)
+
+
+def mget_batched(keys, batch_size=REDIS_BATCH_SIZE):
+    keys = list(keys)
+    values = []
+    for start in range(0, len(keys), batch_size):
+        values.extend(redis_client.mget(keys[start:start + batch_size]))
+    return values
+
+
+def delete_batched(keys, batch_size=REDIS_BATCH_SIZE):
+    keys = list(keys)
+    for start in range(0, len(keys), batch_size):
+        redis_client.unlink(*keys[start:start + batch_size])
+
+
+def add_to_redis(name, value):
+    redis_client.set(key(name), value)
+
+
+def get_from_redis(name):
+    return redis_client.get(key(name))
+
+
+if __name__ == "__main__":
+    # the keyword index's Redis cost for N documents in the real record
+    # format (doc:<path> hashes with packed float32 vectors): one full load,
+    # the per-query check with nothing changed, and applying a write batch.
+    # Runs under its own namespace, which is deleted afterwards.
+    import sys
+
+    import numpy as np
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    os.environ["REDIS_NAMESPACE"] = key("bench")
+    import Redis_Client as bench_client
+    import keywordIndex
+    from documentRecords import iter_vectors, queue_record
+
+    rng = np.random.default_rng(0)
+    record = {"hash": "0" * 64, "size": 1, "mtime": 1, "parser": "pdf", "parser_version": 1, "embedding_model": "bench"}
+
+    def write(paths):
+        pipe = bench_client.redis_client.pipeline(transaction=False)
+        for i, path in enumerate(paths, start=1):
+            queue_record(pipe, path, record, ["keyword", path], rng.random(dim, dtype=np.float32))
+            if i % REDIS_BATCH_SIZE == 0:
+                pipe.execute()
+        pipe.execute()
+
+    try:
+        write([f"/bench/{i}.pdf" for i in range(count)])
+
+        started = time.perf_counter()
+        vectors = sum(1 for _ in iter_vectors())
+        print(f"SCAN + pipelined HGET of packed vectors: {time.perf_counter() - started:.3f}s for {vectors} records x {dim}")
+
+        started = time.perf_counter()
+        with keywordIndex._lock:
+            keywordIndex._load_matrix(dim)
+        print(f"full keyword matrix load: {time.perf_counter() - started:.3f}s")
+
+        started = time.perf_counter()
+        for _ in range(100):
+            with keywordIndex._lock:
+                keywordIndex._refresh(dim)
+        print(f"per query with nothing changed: {(time.perf_counter() - started) * 10:.3f}ms")
+
+        write([f"/bench/{i}.pdf" for i in range(8)] + [f"/bench/new-{i}.pdf" for i in range(8)])
+        started = time.perf_counter()
+        with keywordIndex._lock:
+            keywordIndex._refresh(dim)
+        print(f"first query after a 16-record write batch: {(time.perf_counter() - started) * 1000:.3f}ms "
+              f"({keywordIndex._state['count']} rows)")
+    finally:
+        bench_client.delete_batched(bench_client.scan_keys("*"))
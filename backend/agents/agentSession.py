@@ -0,0 +1,106 @@
+import os
+
+from llmGateway import gateway
+from requestContext import check
+
+AGENT_SESSION_MAX_TURNS = int(os.getenv("AGENT_SESSION_MAX_TURNS", "2"))
+
+
+def _agent_config(agent):
+    config = dict(agent.llm_config or {})
+    if config.get("config_list"):
+        config.update(config["config_list"][0])
+    return config
+
+
+class AgentSession:
+    # Conversation state for one request or ingestion task. The autogen agents
+    # are shared module-level singletons that only hold a system message and
+    # llm_config; every call goes through the shared LLM gateway with its
+    # messages passed explicitly, and whatever context a session keeps is
+    # capped at max_turns exchanges per agent and dropped with the session.
+
+    def __init__(self, max_turns=AGENT_SESSION_MAX_TURNS):
+        self.max_turns = max_turns
+        self._history = {}
+
+    def _messages(self, agent, message):
+        return (
+            [{"role": "system", "content": agent.system_message}]
+            + self._history.get(agent.name, [])
+            + [{"role": "user", "content": message}]
+        )
+
+    def _remember(self, agent, message, reply):
+        history = self._history.setdefault(agent.name, [])
+        history.extend([
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": reply or ""},
+        ])
+        del history[:max(0, len(history) - 2 * self.max_turns)]
+
+    def ask(self, agent, message):
+        check()
+        reply = gateway.chat(self._messages(agent, message), _agent_config(agent))
+        self._remember(agent, message, reply)
+        return reply
+
+    def stream(self, agent, message):
+        check()
+        parts = []
+        for token in gateway.stream_chat(self._messages(agent, message), _agent_config(agent)):
+            # stop reading (and close the upstream stream) once the client is gone
+            check()
+            parts.append(token)
+            yield token
+        self._remember(agent, message, "".join(parts))
+
+    def reply_events(self, agent, message, stream=False):
+        # use as `text = yield from session.reply_events(...)` inside a pipeline generator
+        if not stream:
+            return self.ask(agent, message)
+        parts = []
+        for token in self.stream(agent, message):
+            parts.append(token)
+            yield {"event": "token", "text": token}
+        return "".join(parts)
+
+
+
+if __name__ == "__main__":
+    # python -m agents.agentSession [calls]: against a mock gateway, the
+    # prompts a long-lived session and per-call keyword sessions send stay the
+    # same size, and traced memory stays flat, however many calls go through
+    import sys
+    import tracemalloc
+
+    from agents.keyWordAgent import extract_keywords, keyword_extractor_agent
+
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    sizes = set()
+
+    def mock_chat(messages, config):
+        sizes.add(len(messages))
+        return "['invoice', 'total']"
+
+    # the singleton is shared by every import of this module
+    gateway.chat = mock_chat
+    session = AgentSession()
+
+    def drive(n):
+        for i in range(n):
+            session.ask(keyword_extractor_agent, f"question {i}")
+            extract_keywords(f"document text {i}")
+
+    # warm up until the session history is at its cap and caches are filled
+    drive(100)
+    sizes.clear()
+    tracemalloc.start()
+    drive(calls // 2)
+    first = tracemalloc.get_traced_memory()[0]
+    drive(calls // 2)
+    growth = tracemalloc.get_traced_memory()[0] - first
+    tracemalloc.stop()
+    print(f"{2 * (calls // 2)} ask + extract_keywords calls: message counts {sorted(sizes)}, memory growth {growth} bytes")
+    assert sizes == {2, 2 * session.max_turns + 2}, sizes
+    assert growth < 64 * 1024, growth
@@ -1,14 +1,14 @@
-from autogen import AssistantAgent, UserProxyAgent
+from autogen import AssistantAgent
+import json
 import os
+import re
+from collections import Counter
 from dotenv import load_dotenv
+from agents.agentSession import AgentSession
+from llmConfig import llm_config
 load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-llm_config = {
-    "model": "gemma2-9b-it",
-    "api_key": GROQ_API_KEY,
-    "base_url": "https://api.groq.com/openai/v1",
-    "temperature": 0.3,
-}
+KEYWORD_MAX_WINDOWS = int(os.getenv("KEYWORD_MAX_WINDOWS", "8"))
+KEYWORD_LIMIT = 6
 keyword_extractor_agent = AssistantAgent(
     name="query_analyzer",
     llm_config=llm_config,
@@ -66,8 +66,67 @@ queryKeyWordAgent = AssistantAgent(
 )
 
 
-user_proxy = UserProxyAgent(
-    name="UserProxyAgent",
-    human_input_mode="NEVER",
-    code_execution_config=False
+# fast pipeline: refinement and keyword extraction in one structured call
+queryRefineKeywordAgent = AssistantAgent(
+    name="queryRefineKeywordAgent",
+    llm_config=llm_config,
+    system_message="""
+        You prepare a user's question about corporate documents for search, in a single step.
+
+        Extract the keywords explicitly present in the query: document types, company names,
+        projects, financial, logistics, communication and legal terms, dates.
+        Use the feedback score you are given: -1 means the last search missed, so cover every
+        specific term of the query; 0 or 1 means keep to its central terms.
+        Do NOT infer or add keywords that are not in the query.
+
+        Respond with ONLY a JSON object, nothing else:
+        {"keywords": ["keyword", ...]}
+    """
 )
+
+STOPWORDS = set("""
+a about all also an and any are as at be been but by can could did do does for from get give has have
+how i in is it its list me my of on or our please show tell than that the their them then there these
+this those to us was we were what when where which who why will with would you your
+""".split())
+
+
+def local_query_keywords(text, limit=KEYWORD_LIMIT):
+    # deterministic stand-in for queryKeyWordAgent: the distinct content words
+    # and numbers of the query, in order
+    words = re.findall(r"[A-Za-z0-9][\w&./-]*", text)
+    keywords = [w.lower() for w in words if w.lower() not in STOPWORDS and (len(w) > 2 or w.isdigit())]
+    return list(dict.fromkeys(keywords))[:limit]
+
+
+def extract_keywords(text, instruction="Extract document-related keywords from the following text:", session=None):
+    message = f"""
+{instruction}
+\"\"\"{text}\"\"\"
+"""
+    return (session or AgentSession()).ask(keyword_extractor_agent, message)
+
+
+def extract_keywords_windowed(windows, instruction="Extract document-related keywords from the following text:", window_count=None):
+    # map: one bounded prompt per text window (evenly sampled down to
+    # KEYWORD_MAX_WINDOWS when the window count is known); reduce: keep the
+    # keywords most windows agree on, in the same list format the agent returns
+    from keywordIndex import parse_keywords
+
+    stride = 1
+    if window_count and window_count > KEYWORD_MAX_WINDOWS:
+        stride = -(-window_count // KEYWORD_MAX_WINDOWS)
+    # every window gets a fresh session so earlier windows never ride along in the prompt
+    replies = [
+        extract_keywords(window, instruction)
+        for i, window in enumerate(windows) if i % stride == 0
+    ]
+    if len(replies) <= 1:
+        return replies[0] if replies else extract_keywords("", instruction)
+    counts, first_seen = Counter(), {}
+    for reply in replies:
+        for keyword in dict.fromkeys(k.lower() for k in parse_keywords(reply)):
+            counts[keyword] += 1
+            first_seen.setdefault(keyword, len(first_seen))
+    ranked = sorted(counts, key=lambda k: (-counts[k], first_seen[k]))
+    return json.dumps(ranked[:KEYWORD_LIMIT])
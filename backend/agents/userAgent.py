@@ -1,34 +1,31 @@
 from autogen import AssistantAgent, UserProxyAgent
 from llmConfig import llm_config
-import redis
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from Redis_Client import add_to_redis, get_from_redis, redis_client
+from keywordIndex import parse_keywords, embed_keywords, search as keyword_search
+from corpusIndex import search as corpus_search
 import json
 import os
-from langchain_community.embeddings import OllamaEmbeddings
-from agents.keyWordAgent import keyword_extractor_agent,user_proxy
+from embeddingService import embeddings
+from answerCache import answer_cache, normalize_query
+from contextBuilder import CONTEXT_CANDIDATES, build_context
+import time
+from agents.agentSession import AgentSession
+from requestContext import check
 from dotenv import load_dotenv
-from parsers.pdfParsers import extract_text_from_pdf
-from PyPDF2 import PdfReader
-from dotenv import load_dotenv
-from langchain_community.vectorstores import FAISS
-from langchain.document_loaders import PyPDFLoader
-from agents.keyWordAgent import queryKeyWordAgent
+from agents.keyWordAgent import queryKeyWordAgent, queryRefineKeywordAgent, local_query_keywords
 
 load_dotenv()
 
 os.environ['HF_TOKEN']=os.getenv("HF_TOKEN")
-embeddings=(
-    OllamaEmbeddings(model="gemma:2b")
-)
 
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-    length_function=len,
-)
+# full:  promptingAgent -> queryKeyWordAgent -> getDetailsAgent -> prettierAgent
+# fast:  one refine+keywords call -> getDetailsAgent writing the final format
+# local: local keyword extraction -> getDetailsAgent writing the final format
+PIPELINE_MODES = {
+    "full": {"keywords": "agents", "format": "prettier"},
+    "fast": {"keywords": "merged", "format": "details"},
+    "local": {"keywords": "local", "format": "details"},
+}
+QUERY_PIPELINE_MODE = os.getenv("QUERY_PIPELINE_MODE", "full")
 
 promptingAgent = AssistantAgent(
     name="promptingAgent",
@@ -156,9 +153,10 @@ Ensure that every detail remains **traceable**, **clear**, and **easy to read**.
 )
 
 
-def handle_user_query(data):
+def query_events(data, stream=False):
     userPrompt = data['data']
     userFeedback = data['feedback']
+    session = AgentSession()
 
     feedback_map = {
         -1: "The previous response was unsatisfactory (bad). Please completely restructure the query to be more specific and clear.",
@@ -168,124 +166,142 @@ def handle_user_query(data):
 
     feedback_text = feedback_map.get(userFeedback, "Please improve this query to be more specific and effective.")
 
- 
-    user_proxy.send(
-        recipient=promptingAgent,
-        message=f"""
-        Original Query: {userPrompt}
-        Feedback Score: {userFeedback}
-        Feedback Description: {feedback_text}
-        Please improve this query according to the feedback.
-        """
-    )
-
-    improved_prompt = promptingAgent.generate_reply(sender=user_proxy)
-    user_proxy.receive(sender=promptingAgent, message=improved_prompt)
-
-    # Step 3: Send improved prompt to keyword extractor agent
-    user_proxy.send(
-        recipient= queryKeyWordAgent,
-        message=f"{improved_prompt}"
-    )
-
-    reply = queryKeyWordAgent.generate_reply(sender=user_proxy)
-    user_proxy.receive(sender=queryKeyWordAgent, message=reply)
+    # Repeated or near-duplicate questions over unchanged documents are answered from the cache;
+    # negative feedback means the cached answer was the problem, so it is dropped and recomputed
+    mode_name = data.get('mode') or QUERY_PIPELINE_MODE
+    if mode_name not in PIPELINE_MODES:
+        mode_name = "full"
+    mode = PIPELINE_MODES[mode_name]
+
+    query_vector = embeddings.embed_query(normalize_query(userPrompt))
+    if userFeedback == -1:
+        answer_cache.invalidate(query_vector)
+    else:
+        cached = answer_cache.get(query_vector, mode_name)
+        if cached is not None:
+            yield {"event": "done", "result": {**cached, "cached": True}}
+            return
+    timings = {}
+    clock = [time.perf_counter()]
+
+    def lap(stage):
+        now = time.perf_counter()
+        timings[stage] = round(now - clock[0], 3)
+        clock[0] = now
+        # stop between stages once the deadline passed or the client left
+        check()
+
+    if mode["keywords"] == "agents":
+        yield {"event": "stage", "stage": "refine"}
+        improved_prompt = session.ask(
+            promptingAgent,
+            f"""
+            Original Query: {userPrompt}
+            Feedback Score: {userFeedback}
+            Feedback Description: {feedback_text}
+            Please improve this query according to the feedback.
+            """
+        )
+        lap("refine")
+
+        # Step 3: Send improved prompt to keyword extractor agent
+        yield {"event": "stage", "stage": "keywords"}
+        reply = session.ask(
+            queryKeyWordAgent,
+            f"{improved_prompt}"
+        )
+        topics = parse_keywords(reply)
+    elif mode["keywords"] == "merged":
+        yield {"event": "stage", "stage": "keywords"}
+        reply = session.ask(
+            queryRefineKeywordAgent,
+            f"""
+            Original Query: {userPrompt}
+            Feedback Score: {userFeedback}
+            Feedback Description: {feedback_text}
+            """
+        )
+        try:
+            topics = [str(k) for k in json.loads(reply[reply.find("{"):reply.rfind("}") + 1])["keywords"]]
+        except (ValueError, KeyError, TypeError):
+            topics = parse_keywords(reply)
+    else:
+        yield {"event": "stage", "stage": "keywords"}
+        topics = local_query_keywords(userPrompt)
 
     try:
-        parsedString = reply[1:len(reply) - 3]
-        topics = parsedString.split(",")
-        reply_embedding = embeddings.embed_query(topics)
+        reply_embedding = embed_keywords(topics, embeddings) if topics else None
     except Exception as e:
         topics = []
         reply_embedding = None
+    lap("keywords")
 
     if len(topics) == 0:
-        return {
+        yield {"event": "done", "result": {
             "success": False,
             "message": "No key values found... I can help you with some other queries."
-        }
-
-    files = []
+        }}
+        return
 
-    # Step 5: Redis similarity match
-    for key in redis_client.keys():
-        try:
-            temp = get_from_redis(key)
-            if temp:
-                temp3 = temp[1:len(temp) - 3]
-                temp2 = temp3.split(",")
-                key_embedding = embeddings.embed_query(temp2)
-                similarity = cosine_similarity(
-                    [reply_embedding],
-                    [key_embedding]
-                )[0][0]
-                if similarity > 0.8:
-                    files.append(key)
-        except Exception as e:
-            print(f"Error processing key {key}: {e}")
-            continue
+    # Step 5: Redis similarity match against the precomputed keyword matrix
+    yield {"event": "stage", "stage": "retrieval"}
+    files = [path for path, score in keyword_search(reply_embedding)]
 
     print(f"Found relevant files: {files}")
 
-    context = []
-
-    # Step 6: Load files, split & build FAISS retriever
-    for file_path in files:
-        try:
-            content = extract_text_from_pdf(file_path)
-            print(f"Extracted content from {file_path}: {content}")
-
-            loader = PyPDFLoader(file_path)
-            pages = loader.load()
-
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=30)
-            docs = text_splitter.split_documents(pages)
-
-            db = FAISS.from_documents(docs, embeddings)
-            retriever = db.as_retriever()
-
-            result = retriever.invoke(data)
-            print(f"Result from retriever: {result[0].page_content}")
+    # Step 6: One search over the corpus chunk index, limited to the matched files,
+    # packed best-first into the token budget without overlapping text
+    results = corpus_search(userPrompt, embeddings, files=files, k=CONTEXT_CANDIDATES) if files else []
+    context = build_context(results)
+    lap("retrieval")
 
-            context.append({
-                'file': file_path,
-                'content': result,
-            })
+    print(f"Final context: {context['sources']} (~{context['tokens']} tokens)")
 
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-            continue
-
-    print(f"Final context: {context}")
-
-    # Step 7: Get final response using context
-    user_proxy.send(
-        recipient=getDetailsAgent,
-        message=f"""
-        Query: {data}
+    # Step 7: Get final response using context; without the prettier pass the
+    # details agent writes the display format itself and is the one streamed
+    yield {"event": "stage", "stage": "details", "files": files}
+    details_prompt = f"""
+        Query: {userPrompt}
         
         Context from relevant documents:
-        {context}
+        {context['text']}
         
         Please provide a comprehensive answer based on the above context.
         """
-    )
-
-    final_response = getDetailsAgent.generate_reply(sender=user_proxy)
-    user_proxy.receive(sender=getDetailsAgent, message=final_response)
+    if mode["format"] == "prettier":
+        final_response = session.ask(getDetailsAgent, details_prompt)
+        lap("details")
+
+        yield {"event": "stage", "stage": "format"}
+        final_response = yield from session.reply_events(
+            prettierAgent,
+            f"""
+            Content: {final_response}
+            
+            Please format the response for better readability.
+            """,
+            stream=stream,
+        )
+        lap("format")
+    else:
+        final_response = yield from session.reply_events(
+            getDetailsAgent,
+            details_prompt + "        Format it in clean, readable markdown for direct display to the user.\n",
+            stream=stream,
+        )
+        lap("details")
 
+    print(f"Final response: {final_response}")
+    print(f"Query timings ({mode_name}): {timings}, ~{context['tokens']} context tokens")
+    result = {"content" : final_response, "files" : files}
+    # an answer built without matching documents has nothing to be invalidated
+    # by, and would outlive the ingestion of the documents it was missing
+    if files:
+        answer_cache.put(query_vector, mode_name, files, result)
+    yield {"event": "done", "result": {**result, "timings": timings}}
 
-    user_proxy.send(
-        recipient=prettierAgent,
-        message=f"""
-        Content: {final_response}
-        
-        Please format the response for better readability.
-        """
-    )
-
-    final_response = prettierAgent.generate_reply(sender=user_proxy)
-    user_proxy.receive(sender=prettierAgent, message=final_response)
 
-    print(f"Final response: {final_response}")
-    return {"content" : final_response, "files" : files}
+def handle_user_query(data):
+    for event in query_events(data):
+        if event["event"] == "done":
+            return event["result"]
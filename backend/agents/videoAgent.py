@@ -1,66 +1,144 @@
-import time
 import os
-from pathlib import Path
+import shutil
+import subprocess
+import tempfile
 from dotenv import load_dotenv
-from phi.agent import Agent
-from phi.model.google import Gemini
-from phi.tools.duckduckgo import DuckDuckGo
-from google.generativeai import upload_file, get_file
 import google.generativeai as genai
-from agents.keyWordAgent import keyword_extractor_agent,user_proxy
+from agents.keyWordAgent import extract_keywords
+from documentStore import file_hash
+from Redis_Client import key, redis_client
 
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
 
-if API_KEY:
-    genai.configure(api_key=API_KEY)
-else:
-    raise ValueError("Missing GOOGLE_API_KEY in .env")
-
-def initialize_agent():
-    return Agent(
-        name="Video AI Summarizer",
-        model=Gemini(id="gemini-2.0-flash-exp"),
-        tools=[DuckDuckGo()],
-        markdown=True,
+# "gemini" sends the compact representation to Gemini, "stub" describes it
+# locally without any network call (for tests and offline runs)
+VIDEO_MODEL = os.getenv("VIDEO_MODEL", "gemini")
+VIDEO_GEMINI_MODEL = os.getenv("VIDEO_GEMINI_MODEL", "gemini-2.0-flash")
+VIDEO_KEYFRAMES = int(os.getenv("VIDEO_KEYFRAMES", "8"))
+VIDEO_FRAME_WIDTH = int(os.getenv("VIDEO_FRAME_WIDTH", "512"))
+VIDEO_AUDIO_BITRATE = os.getenv("VIDEO_AUDIO_BITRATE", "32k")
+VIDEO_MAX_AUDIO_BYTES = int(os.getenv("VIDEO_MAX_AUDIO_BYTES", str(15 * 1024 * 1024)))
+VIDEO_PREFIX = key("video") + ":"
+
+PROMPT = """
+Describe the video these keyframes, audio and subtitles were taken from in detail.
+Focus on the visual content, scenes, actions, and any inferred context or theme.
+Keep the description clear, accurate, and user-friendly.
+"""
+
+_models = {}
+
+
+def sample_keyframes(video_path, count=VIDEO_KEYFRAMES):
+    # evenly spaced frames, downscaled and JPEG encoded
+    import cv2
+
+    capture = cv2.VideoCapture(video_path)
+    try:
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total <= 0:
+            return []
+        frames = []
+        for i in range(min(count, total)):
+            capture.set(cv2.CAP_PROP_POS_FRAMES, (2 * i + 1) * total // (2 * min(count, total)))
+            ok, frame = capture.read()
+            if not ok:
+                continue
+            height, width = frame.shape[:2]
+            if width > VIDEO_FRAME_WIDTH:
+                frame = cv2.resize(frame, (VIDEO_FRAME_WIDTH, height * VIDEO_FRAME_WIDTH // width))
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            if ok:
+                frames.append(encoded.tobytes())
+        return frames
+    finally:
+        capture.release()
+
+
+def _ffmpeg(*args):
+    if not shutil.which("ffmpeg"):
+        return None
+    result = subprocess.run(["ffmpeg", "-v", "error", "-y", *args], capture_output=True)
+    return result if result.returncode == 0 else None
+
+
+def extract_subtitles(video_path):
+    result = _ffmpeg("-i", video_path, "-map", "0:s:0", "-f", "srt", "-")
+    if not result:
+        return ""
+    # keep the cue text only, without the sequence numbers and timestamps
+    return "\n".join(
+        line for line in result.stdout.decode("utf-8", "ignore").splitlines()
+        if line.strip() and not line.strip().isdigit() and "-->" not in line
     )
 
-multimodal_agent = initialize_agent()
+
+def extract_audio(video_path):
+    # mono, low bitrate speech track; None when there is no audio or no ffmpeg
+    with tempfile.TemporaryDirectory() as tmp:
+        target = os.path.join(tmp, "audio.mp3")
+        if not _ffmpeg("-i", video_path, "-vn", "-ac", "1", "-ar", "16000", "-b:a", VIDEO_AUDIO_BITRATE, target):
+            return None
+        if os.path.getsize(target) > VIDEO_MAX_AUDIO_BYTES:
+            return None
+        with open(target, "rb") as f:
+            return f.read()
+
+
+def prepare_video(video_path):
+    return {
+        "frames": sample_keyframes(video_path),
+        "subtitles": extract_subtitles(video_path),
+        "audio": extract_audio(video_path),
+    }
+
+
+def gemini_model(prepared):
+    if not API_KEY:
+        raise ValueError("Missing GOOGLE_API_KEY in .env")
+    genai.configure(api_key=API_KEY)
+    parts = [PROMPT]
+    parts.extend({"mime_type": "image/jpeg", "data": frame} for frame in prepared["frames"])
+    if prepared["audio"]:
+        parts.append({"mime_type": "audio/mp3", "data": prepared["audio"]})
+    if prepared["subtitles"]:
+        parts.append("Subtitles:\n" + prepared["subtitles"])
+    return genai.GenerativeModel(VIDEO_GEMINI_MODEL).generate_content(parts).text
+
+
+def stub_model(prepared):
+    description = f"Video with {len(prepared['frames'])} sampled keyframes"
+    if prepared["audio"]:
+        description += " and an audio track"
+    if prepared["subtitles"]:
+        description += ".\nSubtitles:\n" + prepared["subtitles"]
+    return description
+
+
+def register_video_model(name, model):
+    # model(prepared) -> description text
+    _models[name] = model
+
+
+register_video_model("gemini", gemini_model)
+register_video_model("stub", stub_model)
+
+
+def describe_video(video_path):
+    # descriptions are cached by content hash and model, so renamed or copied
+    # videos are never sent to the model twice
+    cache_key = f"{VIDEO_PREFIX}{VIDEO_MODEL}:{file_hash(video_path)}"
+    description = redis_client.get(cache_key)
+    if description is None:
+        description = _models[VIDEO_MODEL](prepare_video(video_path))
+        redis_client.set(cache_key, description)
+    return description
+
 
 def analysis_video(video_path):
     if not os.path.exists(video_path):
-        print("File does not exist.")
-        exit()
-    print("Uploading and processing video...")
-    try:
-        processed_video = upload_file(video_path)
-        while processed_video.state.name == "PROCESSING":
-            time.sleep(1)
-            processed_video = get_file(processed_video.name)
-
-        prompt = """
-        Describe the uploaded video in detail.
-        Focus on the visual content, scenes, actions, and any inferred context or theme.
-        Keep the description clear, accurate, and user-friendly.
-        """
-
-        print("Analyzing video content using AI...")
-        response = multimodal_agent.run(prompt, videos=[processed_video])
-
-        print("\nVideo Description:\n")
-        print(response.content)
-        user_proxy.send(
-        recipient=keyword_extractor_agent,
-        message=f"""
-        Extract company-related keywords from the following text:
-        \"\"\"{response.content}\"\"\"
-        """
-        )
-        reply = keyword_extractor_agent.generate_reply(sender=user_proxy)
-        user_proxy.receive(sender=keyword_extractor_agent, message=reply)
-        return reply
-    except Exception as e:
-        print(f"Error during processing: {e}")
-
-def analysis_video(path):
-    return analysis_video(path)
\ No newline at end of file
+        raise FileNotFoundError(video_path)
+    print(f"Analyzing video {video_path}...")
+    description = describe_video(video_path)
+    return extract_keywords(description, "Extract company-related keywords from the following text:")
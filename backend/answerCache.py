@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from documentRecords import stored_documents
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+def normalize_query(text):
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    # Finished answers keyed by the embedding of the normalized query. An
+    # entry also remembers the content hash of every file the answer was
+    # built from and stops matching as soon as one of them is re-ingested
+    # with different content or removed. The hashes come from the Redis
+    # records, never from the files themselves. Answers from different
+    # pipeline modes are kept apart, since they differ in format and depth.
+
+    def __init__(self, size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD):
+        self.size = size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "expired": 0, "invalidated": 0}
+
+    def _drop(self, entry_id):
+        if self._entries.pop(entry_id, None) is not None:
+            self._matrix = None
+
+    def _closest(self, vector, mode=None):
+        # (entry id, similarity) of the nearest cached query, among the entries
+        # of mode when one is given; caller holds the lock
+        if not self._entries:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix = (
+                list(self._entries),
+                np.stack([e["vector"] for e in self._entries.values()]),
+                np.array([e["mode"] for e in self._entries.values()], dtype=object),
+            )
+        ids, matrix, modes = self._matrix
+        scores = matrix @ vector
+        if mode is not None:
+            scores = np.where(modes == mode, scores, -np.inf)
+        best = int(np.argmax(scores))
+        return ids[best], float(scores[best])
+
+    def get(self, vector, mode):
+        vector = _unit(vector)
+        with self._lock:
+            self._stats["lookups"] += 1
+            entry_id, score = self._closest(vector, mode)
+            if entry_id is None or score < self.threshold:
+                return None
+            entry = self._entries[entry_id]
+            if time.time() - entry["created"] > self.ttl:
+                self._stats["expired"] += 1
+                self._drop(entry_id)
+                return None
+        current = stored_documents([path for path, _ in entry["files"]])
+        if any(current.get(path) != content_hash for path, content_hash in entry["files"]):
+            # one of the documents was re-ingested or removed since
+            with self._lock:
+                self._stats["invalidated"] += 1
+                self._drop(entry_id)
+            return None
+        with self._lock:
+            if entry_id in self._entries:
+                self._entries.move_to_end(entry_id)
+            self._stats["hits"] += 1
+        return entry["result"]
+
+    def put(self, vector, mode, files, result):
+        vector = _unit(vector)
+        current = stored_documents(files)
+        hashes = [(path, current.get(path)) for path in files]
+        with self._lock:
+            entry_id, score = self._closest(vector, mode)
+            if entry_id is not None and score >= self.threshold:
+                self._drop(entry_id)
+            self._entries[self._next_id] = {
+                "vector": vector,
+                "mode": mode,
+                "files": hashes,
+                "result": result,
+                "created": time.time(),
+            }
+            self._next_id += 1
+            self._matrix = None
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, vector):
+        # forget the answer(s) for this query in every mode, e.g. after negative feedback
+        vector = _unit(vector)
+        with self._lock:
+            while True:
+                entry_id, score = self._closest(vector)
+                if entry_id is None or score < self.threshold:
+                    return
+                self._stats["invalidated"] += 1
+                self._drop(entry_id)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries))
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,76 @@
+import os
+import re
+
+from documentStore import CHUNK_OVERLAP
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# retrieval fetches this many chunks; the budget decides how many make it in
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "16"))
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.8"))
+# rough size of a token for the models in use; good enough to budget prompts
+CHARS_PER_TOKEN = 4
+MIN_OVERLAP = 40
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def _similarity(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _strip_overlap(previous, text):
+    # the splitter repeats up to CHUNK_OVERLAP characters between neighbouring
+    # chunks; drop the part of text that is already at either end of previous
+    for size in range(min(CHUNK_OVERLAP, len(previous), len(text)), MIN_OVERLAP - 1, -1):
+        if previous.endswith(text[:size]):
+            return text[size:]
+        if text.endswith(previous[:size]):
+            return text[:-size]
+    return text
+
+
+def label(doc):
+    source = os.path.basename(doc.metadata.get("source") or "unknown")
+    page = doc.metadata.get("page")
+    return f"[{source} p.{page + 1}]" if isinstance(page, int) else f"[{source}]"
+
+
+def build_context(results, budget=CONTEXT_TOKEN_BUDGET):
+    # results are (Document, L2 distance) pairs from any number of searches;
+    # returns the packed prompt text, the labels used and its token estimate
+    blocks, kept, used = [], [], 0
+    seen = {}
+    for doc, _ in sorted(results, key=lambda item: item[1]):
+        text = doc.page_content.strip()
+        place = (doc.metadata.get("source"), doc.metadata.get("page"))
+        for previous in seen.get(place, []):
+            text = _strip_overlap(previous, text).strip()
+        shingles = _shingles(text)
+        if len(text) < MIN_OVERLAP or any(_similarity(shingles, other) >= CONTEXT_DUPLICATE_SIMILARITY for other in kept):
+            continue
+        block = f"{label(doc)}\n{text}"
+        cost = estimate_tokens(block) + 1
+        if used + cost > budget:
+            remaining = (budget - used) * CHARS_PER_TOKEN - len(label(doc)) - 2
+            if remaining < 200:
+                break
+            block = f"{label(doc)}\n{text[:remaining]}"
+            cost = estimate_tokens(block) + 1
+        blocks.append(block)
+        kept.append(shingles)
+        seen.setdefault(place, []).append(doc.page_content)
+        used += cost
+        if used >= budget:
+            break
+    return {
+        "text": "\n\n".join(blocks),
+        "sources": list(dict.fromkeys(block.split("\n", 1)[0] for block in blocks)),
+        "tokens": used,
+    }
@@ -1,29 +1,17 @@
 import os
-from parsers.imageParser import analysis_image
-from parsers.pdfParsers import analyze_pdf, extract_text_from_pdf
-from agents.videoAgent import analysis_video
-from parsers.wordParser import analysis_word
-from Redis_Client import get_from_redis, add_to_redis
 from autogen import AssistantAgent, UserProxyAgent
 from llmConfig import llm_config
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.document_loaders import PyPDFLoader
-from agents.keyWordAgent import keyword_extractor_agent, user_proxy
+from embeddingService import embeddings
+from agents.agentSession import AgentSession
 from dotenv import load_dotenv
-from parsers.wordParser import extract_text_from_docx
-from parsers.imageParser import extract_text
+from corpusIndex import search as corpus_search
+from documentRecords import stored_documents
+from contextBuilder import CONTEXT_CANDIDATES, build_context
+import time
+from controllers.getFolderAnalysis.ingestion import run_ingestion
 load_dotenv()
 
 os.environ['HF_TOKEN'] = os.getenv("HF_TOKEN")
-embeddings = OllamaEmbeddings(model="gemma:2b")
-
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-    length_function=len,
-)
 
 getDetailsAgent = AssistantAgent(
     name="getDetailsAgent",
@@ -110,131 +98,78 @@ Ensure that every detail remains **traceable**, **clear**, and **easy to read**.
 """
 )
 
-def analysisFolder(folder_path):
+def analysisFolder(folder_path, progress=None, cancel_event=None):
     print(f"📂 Analyzing folder: {folder_path}")
-    extracted_data = []
-    for root, _, files in os.walk(folder_path):
-        for file in files:
-            print(file)
-            if file.endswith(".pdf"):
-                full_path = os.path.join(root, file)
-                if(get_from_redis(full_path) == None):
-                    print(f"Analyzing: {full_path}")
-                    try:
-                        result = analyze_pdf(full_path)
-                        add_to_redis(full_path, result)
-                    except Exception as e:
-                        print(f"Error processing {full_path}: {e}")
-            elif file.endswith(".docx"):    
-                full_path = os.path.join(root,file)
-                if(get_from_redis(full_path) == None):
-                    print(f"Analyzing: {full_path}")
-                    try:
-                        result = analysis_word(full_path)
-                     
-                        add_to_redis(full_path, result)
-                    except Exception as e:
-                        print(f"Error processing {full_path} : {e}")
-            elif file.endswith(".jpg") or file.endswith(".png") or file.endswith(".jpeg"):
-                full_path = os.path.join(root,file)
-                if(get_from_redis(full_path) == None):
-                    print(f"Analyzing: {full_path}")
-                    try:
-                        result = analysis_image(full_path)
-               
-                        add_to_redis(full_path, result)
-                    except Exception as e:
-                        print(f"Error processing {full_path} : {e}")
-            elif file.endswith(".xlsx"):
-                full_path = os.path.join(root,file)
-                if(get_from_redis(full_path) == None):
-                    print(f"Analyzing: {full_path}")
-                    try:
-                        result = analysis_video(full_path)
-                    
-                        add_to_redis(full_path, result)
-                    except Exception as e:
-                        print(f"Error processing {full_path} : {e}")
-            elif file.endswith(".mp4"):
-                full_path = os.path.join(root,file)
-                if(get_from_redis(full_path) == None):
-                    print(f"Analyzing: {full_path}")
-                    try:
-                        result = analysis_video(full_path)
-                        add_to_redis(full_path, result)
-                    except Exception as e:
-                        print(f"Error processing {full_path} : {e}")
-                        
+    return run_ingestion(folder_path, progress=progress, cancel_event=cancel_event)
 
-def get_file_info(data):
+
+def file_info_events(data, stream=False):
     userPrompt = data['data']
     files = data['files']
     feedback = data['feedback']
+    session = AgentSession()
     
-    context = []
+    selected_files = []
     
-    # Process each file based on its type
+    # Every supported file type is read from the document store through the
+    # corpus index, so only files that were ingested into it can be answered
     for file_path in files:
-        print(files)
-        print(file_path)
         print(f"Processing file: {file_path['name']}")
-        try:
-            content = None
-            file_path = "documentRepo/" + file_path['name']
-            if file_path.endswith('.pdf'):
-                loader = PyPDFLoader(file_path)
-                pages = loader.load()
-                print(pages)
-                docs = text_splitter.split_documents(pages)
-                db = FAISS.from_documents(docs, embeddings)
-                retriever = db.as_retriever()
-                result = retriever.invoke(userPrompt)
-                content = result[0].page_content if result else None
-                
-            elif file_path == '.docx':
-                content = extract_text_from_docx(file_path)
-                
-            elif file_path in ['.jpg', '.png', '.jpeg']:
-                content = extract_text(file_path)
-            
-            if content:
-                context.append({
-                    'file': file_path,
-                    'content': content
-                })
-            
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-            continue
+        selected_files.append("documentRepo/" + file_path['name'])
+    indexed = stored_documents(selected_files)
+    missing = [file_path for file_path in selected_files if file_path not in indexed]
+    if missing:
+        print(f"Not indexed yet: {missing}")
+    if not indexed:
+        # without any context the agents would only make something up
+        yield {"event": "done", "result": {
+            "success": False,
+            "message": "The selected files are not indexed yet. Run the folder analysis first, then ask again.",
+            "files": files,
+            "missing": missing,
+        }}
+        return
+    selected_files = list(indexed)
+
+    # All selected files are answered from one filtered search over the corpus index
+    yield {"event": "stage", "stage": "retrieval"}
+    results = corpus_search(userPrompt, embeddings, files=selected_files, k=CONTEXT_CANDIDATES) if selected_files else []
+    context = build_context(results)
     
     # Get detailed analysis from getDetailsAgent
-    user_proxy.send(
-        recipient=getDetailsAgent,
-        message=f"""
+    yield {"event": "stage", "stage": "details"}
+    started = time.time()
+    final_response = session.ask(
+        getDetailsAgent,
+        f"""
         Query: {userPrompt}
         
         Context from relevant documents:
-        {context}
+        {context['text']}
         
         Please provide a comprehensive answer based on the above context.
         """
     )
-    
-    final_response = getDetailsAgent.generate_reply(sender=user_proxy)
-    user_proxy.receive(sender=getDetailsAgent, message=final_response)
+    print(f"getDetailsAgent: ~{context['tokens']} context tokens, {time.time() - started:.2f}s")
     
     # Format the response using prettierAgent
-    user_proxy.send(
-        recipient=prettierAgent,
-        message=f"""
+    yield {"event": "stage", "stage": "format"}
+    final_response = yield from session.reply_events(
+        prettierAgent,
+        f"""
         Content: {final_response}
         
         Please format the response for better readability.
-        """
+        """,
+        stream=stream,
     )
-    final_response = prettierAgent.generate_reply(sender=user_proxy)
-    user_proxy.receive(sender=prettierAgent, message=final_response)
-    return {
+    yield {"event": "done", "result": {
         "content": final_response,
         "files": files
-    }
\ No newline at end of file
+    }}
+
+
+def get_file_info(data):
+    for event in file_info_events(data):
+        if event["event"] == "done":
+            return event["result"]
\ No newline at end of file
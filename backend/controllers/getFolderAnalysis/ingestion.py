@@ -0,0 +1,284 @@
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from Redis_Client import REDIS_BATCH_SIZE, key, redis_client
+from agents.keyWordAgent import extract_keywords_windowed
+from corpusIndex import ensure_files, remove_files, save as save_corpus
+from indexCache import get_file_index
+from embeddingService import embeddings
+from documentStore import (
+    document_key, file_hash, is_stored, iter_text_windows, parse_document, window_count,
+    supports as has_document_parser,
+)
+from parserRegistry import analyze as analyze_direct, has_parser, instruction, parser_for
+from keywordIndex import embed_keywords, parse_keywords
+from documentRecords import iter_paths, queue_record, queue_remove, read_records
+
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(os.cpu_count() or 2)))
+INGEST_LLM_CONCURRENCY = int(os.getenv("INGEST_LLM_CONCURRENCY", "4"))
+INGEST_WRITE_BATCH = int(os.getenv("INGEST_WRITE_BATCH", "16"))
+INGEST_VIDEO_CONCURRENCY = int(os.getenv("INGEST_VIDEO_CONCURRENCY", "2"))
+ANALYSIS_PREFIX = key("analysis") + ":"
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def _call(module, function, path):
+    return getattr(importlib.import_module(module), function)(path)
+
+
+def _warm_parser():
+    # each long-lived parse worker imports the store once; parser modules and
+    # the OCR models still load on first use (the first scanned page or image)
+    # and then stay loaded for every later job the worker runs
+    importlib.import_module("documentStore")
+
+
+def get_parse_pool():
+    # shared by every ingestion job for the life of the server; replaced only
+    # if a worker died and broke it
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None or getattr(_parse_pool, "_broken", False):
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=INGEST_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_parser,
+            )
+    return _parse_pool
+
+
+def _collect(folder_path):
+    paths = []
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            path = os.path.join(root, file)
+            if has_parser(path):
+                paths.append(path)
+    return paths
+
+
+def _document_key(record):
+    return document_key(record["hash"], record["parser"], record["parser_version"])
+
+
+def _plan(paths):
+    # stat first and only hash files whose size/mtime moved; unchanged content
+    # at a new path reuses the analysis stored under its document key, which
+    # a parser version bump changes, so that re-parses and re-analyzes
+    skipped, reuse, unknown = 0, [], []
+    for start in range(0, len(paths), REDIS_BATCH_SIZE):
+        batch = paths[start:start + REDIS_BATCH_SIZE]
+        records = read_records(batch, ("hash", "size", "mtime", "parser", "parser_version", "embedding_model"))
+        # analyses from before per-document records only exist under the path key
+        legacy = redis_client.mget([key(path) for path in batch])
+        for path, record, reply in zip(batch, records, legacy):
+            st = os.stat(path)
+            parser = parser_for(path)
+            if (
+                record and record["size"] == st.st_size and record["mtime"] == st.st_mtime_ns
+                and record.get("parser") == parser["name"] and record.get("parser_version") == parser["version"]
+                # a new embedding model re-embeds the keywords (reusing the stored analysis)
+                and record.get("embedding_model") == embeddings.model
+                # a wiped or version-bumped document store re-parses the file
+                and (not parser["extract"] or is_stored(_document_key(record)))
+            ):
+                skipped += 1
+                continue
+            current = {
+                "size": st.st_size,
+                "mtime": st.st_mtime_ns,
+                "hash": file_hash(path),
+                "parser": parser["name"],
+                "parser_version": parser["version"],
+                "embedding_model": embeddings.model,
+            }
+            # path-key analyses were made by version 1 parsers
+            if record is None and reply is not None and parser["version"] == 1:
+                reuse.append((path, reply, current))
+            else:
+                unknown.append((path, current))
+
+    analyze = []
+    for start in range(0, len(unknown), REDIS_BATCH_SIZE):
+        batch = unknown[start:start + REDIS_BATCH_SIZE]
+        stored = redis_client.mget([ANALYSIS_PREFIX + _document_key(record) for _, record in batch])
+        for (path, record), reply in zip(batch, stored):
+            if reply is not None:
+                reuse.append((path, reply, record))
+            else:
+                analyze.append((path, record))
+    return skipped, reuse, analyze
+
+
+def remove_documents(paths):
+    for start in range(0, len(paths), REDIS_BATCH_SIZE):
+        pipe = redis_client.pipeline()
+        for path in paths[start:start + REDIS_BATCH_SIZE]:
+            queue_remove(pipe, path)
+        pipe.execute()
+    documents = [path for path in paths if has_document_parser(path)]
+    if documents:
+        # one corpus update and save for the whole set
+        remove_files(documents, embeddings)
+
+
+def _remove_deleted(folder_path, seen):
+    removed = [
+        path for path in iter_paths(os.path.join(folder_path, ""))
+        if path not in seen and not os.path.exists(path)
+    ]
+    remove_documents(removed)
+    return removed
+
+
+def _index(path, reply, record):
+    if not reply:
+        raise ValueError("no analysis result")
+    keywords = parse_keywords(reply)
+    vector = embed_keywords(keywords, embeddings) if keywords else None
+    if has_document_parser(path):
+        # reused analyses (moved files, documents from before the store, a
+        # wiped store) may have no stored parse yet; a no-op for the others
+        parse_document(path)
+        # embed the chunks here, in parallel; _flush merges them into the corpus
+        get_file_index(path, embeddings, _document_key(record))
+    return path, reply, keywords, vector, record
+
+
+def _keywords(path, record):
+    # the text is read back from the document store in bounded windows, so a
+    # large document never has to be held in memory or sent in a single prompt
+    reply = extract_keywords_windowed(
+        iter_text_windows(path),
+        instruction(path),
+        window_count=window_count(path),
+    )
+    return _index(path, reply, record)
+
+
+def _analyze(path, record):
+    return _index(path, analyze_direct(path), record)
+
+
+def _flush(writes):
+    if not writes:
+        return
+    # one corpus merge per batch; the file is saved once, at the end of the job
+    ensure_files([path for path, *_ in writes if has_document_parser(path)], embeddings, save=False)
+    pipe = redis_client.pipeline()
+    for path, reply, keywords, vector, record in writes:
+        pipe.set(ANALYSIS_PREFIX + _document_key(record), reply)
+        # the record is written last: its presence marks the file as done
+        queue_record(pipe, path, record, keywords, vector)
+    pipe.execute()
+    writes.clear()
+
+
+def run_ingestion(folder_path, progress=None, cancel_event=None):
+    started = time.time()
+    paths = _collect(folder_path)
+    skipped, reuse, analyze = _plan(paths)
+    status = {
+        "folder": folder_path,
+        "total": len(paths),
+        "skipped": skipped,
+        "reused": len(reuse),
+        "processed": 0,
+        "removed": _remove_deleted(folder_path, set(paths)),
+        "failed": [],
+        "cancelled": False,
+        "seconds": 0.0,
+    }
+
+    def report():
+        status["seconds"] = round(time.time() - started, 2)
+        done = status["skipped"] + status["processed"] + len(status["failed"])
+        print(f"📊 Ingestion {done}/{status['total']} (failed: {len(status['failed'])})")
+        if progress:
+            progress(dict(status))
+
+    # direct analyzers (video) are slow and remote-bound: they run in their own
+    # pool, outside the window, so they never hold up the document pipeline
+    pending = deque(item for item in analyze if has_document_parser(item[0]))
+    pending_direct = deque(item for item in analyze if not has_document_parser(item[0]))
+    report()
+
+    parse_pool = get_parse_pool()
+    llm_pool = ThreadPoolExecutor(max_workers=INGEST_LLM_CONCURRENCY)
+    direct_pool = ThreadPoolExecutor(max_workers=INGEST_VIDEO_CONCURRENCY)
+    window = INGEST_PARSE_WORKERS * 2 + INGEST_LLM_CONCURRENCY * 2
+    parsing, analyzing, direct = {}, {}, set()
+    writes = []
+    try:
+        # known content (moved, copied or touched files): index without the LLM
+        for path, reply, record in reuse:
+            analyzing[llm_pool.submit(_index, path, reply, record)] = path
+
+        while pending or pending_direct or parsing or analyzing:
+            if cancel_event is not None and cancel_event.is_set() and not status["cancelled"]:
+                # stop feeding new files; in-flight ones finish and get flushed
+                status["cancelled"] = True
+                pending.clear()
+                pending_direct.clear()
+                for future in list(parsing) + list(analyzing):
+                    if future.cancel():
+                        parsing.pop(future, None)
+                        analyzing.pop(future, None)
+                        direct.discard(future)
+                if not parsing and not analyzing:
+                    break
+            while pending and len(parsing) + len(analyzing) - len(direct) < window:
+                path, record = pending.popleft()
+                # parsed once into the document store; later stages read from there
+                parsing[parse_pool.submit(_call, "documentStore", "parse_document", path)] = (path, record)
+            while pending_direct and len(direct) < INGEST_VIDEO_CONCURRENCY:
+                path, record = pending_direct.popleft()
+                future = direct_pool.submit(_analyze, path, record)
+                analyzing[future] = path
+                direct.add(future)
+
+            done, _ = wait(list(parsing) + list(analyzing), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in parsing:
+                    path, record = parsing.pop(future)
+                    if status["cancelled"]:
+                        # parsed after the cancel: keep the store entry, skip the LLM
+                        continue
+                    try:
+                        parsed = future.result()
+                        record.update({k: v for k, v in parsed.items() if k in ("pages", "ocr_pages", "ocr_seconds")})
+                        analyzing[llm_pool.submit(_keywords, path, record)] = path
+                    except Exception as e:
+                        print(f"Error processing {path} : {e}")
+                        status["failed"].append({"file": path, "error": str(e)})
+                    continue
+                path = analyzing.pop(future)
+                direct.discard(future)
+                try:
+                    writes.append(future.result())
+                    status["processed"] += 1
+                except Exception as e:
+                    print(f"Error processing {path} : {e}")
+                    status["failed"].append({"file": path, "error": str(e)})
+
+            if len(writes) >= INGEST_WRITE_BATCH:
+                _flush(writes)
+                report()
+    finally:
+        _flush(writes)
+        save_corpus()
+        # the pool outlives the job; only this job's queued parses are dropped
+        for future in parsing:
+            future.cancel()
+        llm_pool.shutdown(cancel_futures=True)
+        direct_pool.shutdown(cancel_futures=True)
+
+    report()
+    return status
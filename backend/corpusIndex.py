@@ -0,0 +1,350 @@
+import os
+import pickle
+import threading
+import uuid
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from documentRecords import stored_documents
+from documentStore import current_key, supports
+from requestContext import check
+from indexCache import INDEX_CACHE_DIR, get_file_index
+
+CORPUS_DIR = os.path.join(INDEX_CACHE_DIR, "corpus")
+CORPUS_TOP_K = int(os.getenv("CORPUS_TOP_K", "8"))
+# none keeps the exact flat index; fp16 / sq8 scalar-quantize every vector to
+# 2 / 1 bytes per dimension; pq stores CORPUS_PQ_M bytes per vector. Quantized
+# search fetches k * CORPUS_RERANK candidates and re-ranks them with the exact
+# vectors from the (memory-mapped) per-file indexes.
+CORPUS_QUANTIZATION = os.getenv("CORPUS_QUANTIZATION", "none")
+CORPUS_QUANTIZE_MIN = int(os.getenv("CORPUS_QUANTIZE_MIN", "20000"))
+CORPUS_PQ_M = int(os.getenv("CORPUS_PQ_M", "64"))
+CORPUS_RERANK = int(os.getenv("CORPUS_RERANK", "4"))
+TRAIN_SAMPLE = 100_000
+DECODE_BLOCK_ROWS = 4096
+
+_lock = threading.RLock()
+_save_lock = threading.Lock()
+# files: abspath -> {"hash": document key (content hash + parser version), "ids": docstore ids of its chunks};
+# dirty: changed since the last snapshot; saved: sequence of the newest file on disk
+_state = {"db": None, "files": {}, "positions": None, "loaded": False, "dirty": False, "snapshots": 0, "saved": 0}
+
+
+def _db(embeddings):
+    with _lock:
+        if not _state["loaded"]:
+            _state["loaded"] = True
+            if os.path.exists(os.path.join(CORPUS_DIR, "index.faiss")):
+                index = faiss.read_index(os.path.join(CORPUS_DIR, "index.faiss"))
+                with open(os.path.join(CORPUS_DIR, "index.pkl"), "rb") as f:
+                    docstore, index_to_docstore_id, files = pickle.load(f)
+                _state["db"] = FAISS(embeddings, index, docstore, index_to_docstore_id)
+                _state["files"] = files
+        return _state["db"]
+
+
+def _snapshot():
+    # caller holds _lock; serializing to memory is quick, and the disk write
+    # happens in _write after the lock is released so searches are not held up
+    db = _state["db"]
+    _state["dirty"] = False
+    _state["snapshots"] += 1
+    return (
+        _state["snapshots"],
+        faiss.serialize_index(db.index),
+        pickle.dumps((db.docstore, db.index_to_docstore_id, _state["files"])),
+    )
+
+
+def _write(snapshot):
+    sequence, index_bytes, metadata = snapshot
+    with _save_lock:
+        if sequence < _state["saved"]:
+            return
+        os.makedirs(CORPUS_DIR, exist_ok=True)
+        tmp = os.path.join(CORPUS_DIR, f"index.faiss.tmp-{os.getpid()}")
+        index_bytes.tofile(tmp)
+        os.replace(tmp, os.path.join(CORPUS_DIR, "index.faiss"))
+        tmp = os.path.join(CORPUS_DIR, f"index.pkl.tmp-{os.getpid()}")
+        with open(tmp, "wb") as f:
+            f.write(metadata)
+        os.replace(tmp, os.path.join(CORPUS_DIR, "index.pkl"))
+        _state["saved"] = sequence
+
+
+def save():
+    # ingestion merges every batch with save=False and saves once at the end
+    with _lock:
+        if _state["db"] is None or not _state["dirty"]:
+            return
+        snapshot = _snapshot()
+    _write(snapshot)
+
+
+def _file_chunks(path, embeddings, doc_key=None):
+    # reuse the per-file cached vectors instead of embedding the chunks again
+    file_db = get_file_index(path, embeddings, doc_key)
+    vectors = file_db.index.reconstruct_n(0, file_db.index.ntotal)
+    texts, metadatas = [], []
+    for i in range(file_db.index.ntotal):
+        doc = file_db.docstore.search(file_db.index_to_docstore_id[i])
+        texts.append(doc.page_content)
+        # "chunk" is the vector's position in the per-file index, used for re-ranking
+        metadatas.append({**doc.metadata, "source": path, "chunk": i})
+    return texts, vectors, metadatas
+
+
+def _remove(path):
+    entry = _state["files"].pop(path, None)
+    if entry and entry["ids"] and _state["db"] is not None:
+        _state["db"].delete(entry["ids"])
+        _state["positions"] = None
+    return entry is not None
+
+
+def _quantizer(dim, kind):
+    if kind == "fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    if kind == "sq8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    if kind == "pq":
+        # the sub-vector count has to divide the dimension
+        m = max(m for m in range(1, min(CORPUS_PQ_M, dim) + 1) if dim % m == 0)
+        return faiss.IndexPQ(dim, m, 8)
+    raise ValueError(f"unknown CORPUS_QUANTIZATION: {kind}")
+
+
+def quantize_index(index, kind):
+    vectors = index.reconstruct_n(0, index.ntotal)
+    quantized = _quantizer(index.d, kind)
+    sample = vectors[np.random.default_rng(0).permutation(len(vectors))[:TRAIN_SAMPLE]]
+    quantized.train(sample)
+    quantized.add(vectors)
+    return quantized
+
+
+def _maybe_quantize(db):
+    # the corpus stays exact until it is big enough to train on, then it is
+    # re-encoded once; files added later are encoded by the trained index
+    if (
+        CORPUS_QUANTIZATION != "none" and isinstance(db.index, faiss.IndexFlat)
+        and db.index.ntotal >= CORPUS_QUANTIZE_MIN
+    ):
+        db.index = quantize_index(db.index, CORPUS_QUANTIZATION)
+        print(f"Quantized corpus index ({CORPUS_QUANTIZATION}, {db.index.ntotal} vectors)")
+
+
+def ensure_files(paths, embeddings, save=True, hashes=None):
+    # hashes (abspath -> document key) comes from the Redis records at query
+    # time; without it the files themselves are checked, as ingestion does
+    if hashes is None:
+        paths = [path for path in paths if supports(path)]
+
+    def current(path):
+        return hashes[path] if hashes is not None else current_key(path)
+
+    # build missing per-file indexes before taking the corpus lock so that
+    # concurrent ingestion workers only serialize on the cheap merge step
+    for file_path in paths:
+        # a query that timed out or lost its client stops building indexes here
+        check()
+        path = os.path.abspath(file_path)
+        entry = _state["files"].get(path)
+        try:
+            if not entry or entry["hash"] != current(path):
+                get_file_index(path, embeddings, current(path))
+        except Exception as e:
+            print(f"Error indexing {path}: {e}")
+
+    changed, snapshot = False, None
+    with _lock:
+        db = _db(embeddings)
+        for file_path in paths:
+            path = os.path.abspath(file_path)
+            try:
+                doc_key = current(path)
+                entry = _state["files"].get(path)
+                if entry and entry["hash"] == doc_key:
+                    continue
+                texts, vectors, metadatas = _file_chunks(path, embeddings, doc_key)
+                _remove(path)
+                ids = [str(uuid.uuid4()) for _ in texts]
+                if texts:
+                    pairs = list(zip(texts, vectors.tolist()))
+                    if db is None:
+                        db = FAISS.from_embeddings(pairs, embeddings, metadatas=metadatas, ids=ids)
+                        _state["db"] = db
+                    else:
+                        db.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+                _state["files"][path] = {"hash": doc_key, "ids": ids}
+                _state["positions"] = None
+                changed = True
+            except Exception as e:
+                print(f"Error indexing {path}: {e}")
+        if changed:
+            _maybe_quantize(db)
+            _state["dirty"] = True
+            if save:
+                snapshot = _snapshot()
+    if snapshot:
+        _write(snapshot)
+
+
+def remove_files(paths, embeddings, save=True):
+    snapshot = None
+    with _lock:
+        _db(embeddings)
+        for file_path in paths:
+            if _remove(os.path.abspath(file_path)):
+                _state["dirty"] = True
+        if save and _state["dirty"] and _state["db"] is not None:
+            snapshot = _snapshot()
+    if snapshot:
+        _write(snapshot)
+
+
+def _index_search(index, query_vector, fetch, allowed=None):
+    # allowed: corpus positions the search is limited to, or None for all
+    if allowed is None:
+        return index.search(query_vector, fetch)
+    if not isinstance(index, faiss.IndexPQ):
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(allowed, dtype=np.int64)))
+        return index.search(query_vector, fetch, params=params)
+    # IndexPQ rejects any SearchParameters, so it cannot take an IDSelector
+    if len(allowed) * 4 > index.ntotal:
+        # most of the corpus is allowed: widen an unfiltered search until enough survive
+        allowed, wider = set(allowed), fetch
+        while True:
+            wider = min(index.ntotal, wider * 4)
+            distances, indices = index.search(query_vector, wider)
+            keep = [j for j, position in enumerate(indices[0]) if position in allowed][:fetch]
+            if len(keep) == fetch or wider == index.ntotal:
+                return distances[:, keep], indices[:, keep]
+    # a small subset: decode just those codes block by block and score them,
+    # the same distance the PQ search itself would report
+    positions = np.array(allowed, dtype=np.int64)
+    distances = np.empty(len(positions), dtype=np.float32)
+    for start in range(0, len(positions), DECODE_BLOCK_ROWS):
+        block = index.reconstruct_batch(positions[start:start + DECODE_BLOCK_ROWS])
+        distances[start:start + len(block)] = ((block - query_vector[0]) ** 2).sum(axis=1)
+    top = np.argsort(distances)[:fetch]
+    return distances[top][None], positions[top][None]
+
+
+def _positions():
+    if _state["positions"] is None:
+        _state["positions"] = {
+            doc_id: pos for pos, doc_id in _state["db"].index_to_docstore_id.items()
+        }
+    return _state["positions"]
+
+
+def search(query, embeddings, files=None, k=CORPUS_TOP_K):
+    if files is not None:
+        # the current content version of each file comes from its Redis
+        # record, so a query never opens, hashes or parses an original file;
+        # files that were never ingested into the store are simply not found
+        hashes = {os.path.abspath(path): doc_key for path, doc_key in stored_documents(files).items()}
+        files = list(hashes)
+        ensure_files(files, embeddings, hashes=hashes)
+    query_vector = np.array([embeddings.embed_query(query)], dtype=np.float32)
+    check()
+    with _lock:
+        db = _db(embeddings)
+        if db is None or db.index.ntotal == 0:
+            return []
+        allowed = None
+        if files is not None:
+            positions = _positions()
+            allowed = [
+                positions[doc_id]
+                for file_path in files
+                for doc_id in _state["files"].get(os.path.abspath(file_path), {}).get("ids", [])
+            ]
+            if not allowed:
+                return []
+        exact = isinstance(db.index, faiss.IndexFlat)
+        distances, indices = _index_search(db.index, query_vector, k if exact else k * CORPUS_RERANK, allowed)
+        results = []
+        for distance, position in zip(distances[0], indices[0]):
+            if position == -1:
+                continue
+            doc = db.docstore.search(db.index_to_docstore_id[int(position)])
+            results.append((doc, float(distance)))
+    if exact:
+        return results
+    return sorted(_rerank(results, query_vector[0], embeddings), key=lambda item: item[1])[:k]
+
+
+def _rerank(results, query_vector, embeddings):
+    reranked = []
+    for doc, distance in results:
+        try:
+            doc_key = _state["files"][doc.metadata["source"]]["hash"]
+            file_db = get_file_index(doc.metadata["source"], embeddings, doc_key)
+            vector = file_db.index.reconstruct(int(doc.metadata["chunk"]))
+            distance = float(np.sum((vector - query_vector) ** 2))
+        except Exception:
+            # entries from before chunk positions were recorded keep their approximate distance
+            pass
+        reranked.append((doc, distance))
+    return reranked
+
+
+if __name__ == "__main__":
+    # recall@k and memory of every encoding against the exact index, on the
+    # chunk vectors of a sample folder scaled up with jittered copies; then
+    # the filtered path queries take, limited to a small and a large subset
+    import sys
+    import time
+
+    from embeddingService import embeddings
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else "documentRepo"
+    target = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    k = CORPUS_TOP_K
+    base = np.vstack([
+        _file_chunks(os.path.abspath(os.path.join(root, name)), embeddings)[1]
+        for root, _, names in os.walk(folder) for name in names
+        if supports(os.path.join(root, name))
+    ]).astype(np.float32)
+    rng = np.random.default_rng(0)
+    noise = float(base.std()) * 0.05
+    copies = -(-target // len(base))
+    data = np.vstack([base + rng.normal(0, noise, base.shape) for _ in range(copies)])[:target].astype(np.float32)
+    queries = (data[rng.choice(len(data), 200)] + rng.normal(0, noise, (200, data.shape[1]))).astype(np.float32)
+    print(f"{len(base)} chunks from {folder} scaled to {len(data)} x {data.shape[1]}")
+
+    flat = faiss.IndexFlatL2(data.shape[1])
+    flat.add(data)
+    _, truth = flat.search(queries, k)
+    indexes = {}
+    for kind in ("none", "fp16", "sq8", "pq"):
+        index = indexes[kind] = flat if kind == "none" else quantize_index(flat, kind)
+        size = faiss.serialize_index(index).nbytes / 2**20
+        started = time.perf_counter()
+        _, found = index.search(queries, k * CORPUS_RERANK)
+        ms = (time.perf_counter() - started) * 1000 / len(queries)
+        recall = np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth)])
+        reranked = [
+            c[np.argsort(((data[c] - q) ** 2).sum(axis=1))[:k]]
+            for c, q in ((f[f >= 0], q) for f, q in zip(found, queries))
+        ]
+        recall_rerank = np.mean([len(set(r) & set(t)) / k for r, t in zip(reranked, truth)])
+        print(f"{kind:>5}: {size:9.1f} MiB  recall@{k} {recall:.3f}  re-ranked {recall_rerank:.3f}  {ms:.2f} ms/query")
+
+    for share in (0.05, 0.5):
+        allowed = np.sort(rng.choice(len(data), int(len(data) * share), replace=False))
+        subset = faiss.IndexFlatL2(data.shape[1])
+        subset.add(data[allowed])
+        _, truth = subset.search(queries, k)
+        truth = allowed[truth]
+        for kind, index in indexes.items():
+            started = time.perf_counter()
+            found = [_index_search(index, q[None], k * CORPUS_RERANK, allowed.tolist())[1][0] for q in queries]
+            ms = (time.perf_counter() - started) * 1000 / len(queries)
+            outside = sum(int(np.sum(~np.isin(f[f >= 0], allowed))) for f in found)
+            recall = np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth)])
+            print(f"{kind:>5} filtered to {share:.0%}: recall@{k} {recall:.3f}  {outside} outside  {ms:.2f} ms/query")
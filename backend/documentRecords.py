@@ -0,0 +1,166 @@
+import json
+import os
+
+import numpy as np
+
+from Redis_Client import REDIS_BATCH_SIZE, binary_client, glob_escape, key
+from documentStore import document_key
+from parserRegistry import PARSERS
+
+# one Redis hash per ingested document, replacing the raw reply string under
+# the path key, the JSON manifest entry and the JSON keyword vector
+RECORD_PREFIX = key("doc") + ":"
+# every record write or delete appends its path to this stream, so a cached
+# keyword matrix applies just those changes instead of reloading everything
+CHANGES_KEY = key("doc_changes")
+CHANGES_MAXLEN = int(os.getenv("DOC_CHANGES_MAXLEN", "10000"))
+VECTOR_DTYPE = np.float32
+RECORD_FIELDS = (
+    "keywords", "hash", "size", "mtime", "parser", "parser_version", "embedding_model",
+    "pages", "ocr_pages", "ocr_seconds",
+)
+
+# pre-record layout, cleared whenever a document's record is written or removed
+LEGACY_MANIFEST_KEY = key("manifest")
+LEGACY_EMBEDDINGS_KEY = key("keyword_embeddings")
+
+_decoders = {
+    "keywords": json.loads,
+    "hash": bytes.decode,
+    "size": int,
+    "mtime": int,
+    "parser": bytes.decode,
+    "parser_version": int,
+    "embedding_model": bytes.decode,
+    "pages": int,
+    "ocr_pages": json.loads,
+    "ocr_seconds": float,
+}
+
+
+def record_key(path):
+    return RECORD_PREFIX + path
+
+
+def pack_vector(vector):
+    return np.asarray(vector, dtype=VECTOR_DTYPE).tobytes()
+
+
+def unpack_vector(raw):
+    # a read-only view over the Redis bytes, no parsing and no copy
+    return np.frombuffer(raw, dtype=VECTOR_DTYPE)
+
+
+def queue_record(pipe, path, record, keywords, vector):
+    fields = {
+        "keywords": json.dumps(keywords),
+        "hash": record["hash"],
+        "size": record["size"],
+        "mtime": record["mtime"],
+        "parser": record["parser"],
+        "parser_version": record["parser_version"],
+        "embedding_model": record["embedding_model"],
+        "pages": record.get("pages", 1),
+        "ocr_pages": json.dumps(record.get("ocr_pages", [])),
+        "ocr_seconds": record.get("ocr_seconds", 0.0),
+    }
+    if vector is not None:
+        fields["vector"] = pack_vector(vector)
+    queue_remove(pipe, path)
+    pipe.hset(record_key(path), mapping=fields)
+
+
+def queue_remove(pipe, path):
+    pipe.delete(record_key(path), key(path))
+    pipe.hdel(LEGACY_MANIFEST_KEY, path)
+    pipe.hdel(LEGACY_EMBEDDINGS_KEY, path)
+    pipe.xadd(CHANGES_KEY, {"path": path}, maxlen=CHANGES_MAXLEN, approximate=True)
+
+
+def last_change():
+    entries = binary_client.xrevrange(CHANGES_KEY, count=1)
+    return entries[0][0].decode() if entries else "0-0"
+
+
+def read_changes(cursor, limit):
+    # (new cursor, changed paths) since cursor, or None when there are more
+    # than limit or the stream no longer reaches back to cursor (trimmed or
+    # flushed) and the caller has to reload everything
+    if cursor == "0-0":
+        entries = binary_client.xrange(CHANGES_KEY, count=limit + 1)
+        # approximate trimming never leaves fewer than CHANGES_MAXLEN entries
+        if entries and binary_client.xlen(CHANGES_KEY) >= CHANGES_MAXLEN:
+            return None
+    else:
+        entries = binary_client.xrange(CHANGES_KEY, min=cursor, count=limit + 2)
+        if not entries or entries[0][0].decode() != cursor:
+            return None
+        entries = entries[1:]
+    if len(entries) > limit:
+        return None
+    if not entries:
+        return cursor, []
+    return entries[-1][0].decode(), list(dict.fromkeys(fields[b"path"].decode() for _, fields in entries))
+
+
+def _decode(fields, values):
+    if all(value is None for value in values):
+        return None
+    return {
+        name: _decoders[name](value) if name in _decoders else unpack_vector(value)
+        for name, value in zip(fields, values) if value is not None
+    }
+
+
+def read_records(paths, fields=RECORD_FIELDS):
+    # pipelined HMGET in batches; None for paths without a record
+    records = []
+    for start in range(0, len(paths), REDIS_BATCH_SIZE):
+        pipe = binary_client.pipeline(transaction=False)
+        for path in paths[start:start + REDIS_BATCH_SIZE]:
+            pipe.hmget(record_key(path), fields)
+        records.extend(_decode(fields, values) for values in pipe.execute())
+    return records
+
+
+def stored_documents(paths):
+    # path -> document key recorded at ingestion, for the paths whose record
+    # says they are in the document store; records are keyed by the path as
+    # ingested, so each path is also tried in its absolute form
+    variants = {}
+    for path in paths:
+        for variant in (path, os.path.abspath(path)):
+            variants.setdefault(variant, path)
+    found = {}
+    for variant, record in zip(variants, read_records(list(variants), ("hash", "parser", "parser_version"))):
+        parser = PARSERS.get(record.get("parser")) if record else None
+        if parser and parser["extract"] and "hash" in record:
+            doc_key = document_key(record["hash"], parser["name"], record.get("parser_version", 1))
+            found.setdefault(variants[variant], doc_key)
+    return found
+
+
+def iter_paths(prefix=""):
+    for name in binary_client.scan_iter(match=glob_escape(RECORD_PREFIX + prefix) + "*", count=REDIS_BATCH_SIZE):
+        yield name.decode()[len(RECORD_PREFIX):]
+
+
+def iter_vectors():
+    # (path, packed vector bytes) for every record that has a keyword vector
+    paths = []
+    for path in iter_paths():
+        paths.append(path)
+        if len(paths) >= REDIS_BATCH_SIZE:
+            yield from _vectors(paths)
+            paths = []
+    if paths:
+        yield from _vectors(paths)
+
+
+def _vectors(paths):
+    pipe = binary_client.pipeline(transaction=False)
+    for path in paths:
+        pipe.hget(record_key(path), "vector")
+    for path, raw in zip(paths, pipe.execute()):
+        if raw:
+            yield path, raw
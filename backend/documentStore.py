@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from parserRegistry import can_extract, extract, parser_for
+
+DOCUMENT_STORE_DIR = os.getenv(
+    "DOCUMENT_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "documents"),
+)
+DOCUMENT_STORE_VERSION = 2
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+KEYWORD_WINDOW_CHARS = int(os.getenv("KEYWORD_WINDOW_CHARS", "12000"))
+
+_splitter = None
+_hash_memo = {}
+_build_locks = {}
+_lock = threading.Lock()
+
+
+class DocumentNotStored(LookupError):
+    pass
+
+
+def _text_splitter():
+    # langchain is only needed once something is actually chunked
+    global _splitter
+    if _splitter is None:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        _splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            length_function=len,
+        )
+    return _splitter
+
+
+def file_hash(path):
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    memo = _hash_memo.get(path)
+    if memo and memo[0] == st.st_size and memo[1] == st.st_mtime_ns:
+        return memo[2]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    content_hash = digest.hexdigest()
+    _hash_memo[path] = (st.st_size, st.st_mtime_ns, content_hash)
+    return content_hash
+
+
+def document_key(content_hash, parser_name, parser_version):
+    # one stored parse per content and parser version. Version 1 parsers keep
+    # the bare content hash, so existing stores, chunk indexes and analyses
+    # keep their keys; bumping a parser's version gives every document it
+    # handles a new key, which re-extracts, re-analyzes and re-indexes them
+    if parser_version == 1:
+        return content_hash
+    return f"{content_hash}-{parser_name}{parser_version}"
+
+
+def current_key(path):
+    parser = parser_for(path)
+    return document_key(file_hash(path), parser["name"], parser["version"])
+
+
+def supports(path):
+    return can_extract(path)
+
+
+def _store_path(doc_key):
+    return os.path.join(DOCUMENT_STORE_DIR, f"{doc_key}-v{DOCUMENT_STORE_VERSION}.jsonl.gz")
+
+
+def _meta_path(doc_key):
+    return os.path.join(DOCUMENT_STORE_DIR, f"{doc_key}-v{DOCUMENT_STORE_VERSION}.meta.json")
+
+
+def _chunk_bounds(text):
+    # chunk boundaries as [start, end) offsets into the page text
+    bounds, cursor = [], 0
+    for chunk in _text_splitter().split_text(text):
+        start = text.find(chunk, max(0, cursor - CHUNK_OVERLAP))
+        if start == -1:
+            start = text.find(chunk)
+        bounds.append([start, start + len(chunk)])
+        cursor = start + len(chunk)
+    return bounds
+
+
+def _write(path, doc_key, extracted):
+    # pages are streamed into gzip'd JSON lines one at a time; the metadata
+    # sidecar is written last and doubles as the "complete" marker
+    os.makedirs(DOCUMENT_STORE_DIR, exist_ok=True)
+    suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+    page_count, chars = 0, 0
+    with gzip.open(_store_path(doc_key) + suffix, "wt", encoding="utf-8") as f:
+        for number, text in enumerate(extracted["pages"]):
+            text = text or ""
+            f.write(json.dumps({"page": number, "text": text, "chunks": _chunk_bounds(text)}) + "\n")
+            page_count += 1
+            chars += len(text)
+    os.replace(_store_path(doc_key) + suffix, _store_path(doc_key))
+    parser = parser_for(path)
+    metadata = {
+        "hash": file_hash(path),
+        "key": doc_key,
+        "type": parser["name"],
+        "parser_version": parser["version"],
+        "version": DOCUMENT_STORE_VERSION,
+        "pages": page_count,
+        "chars": chars,
+        **extracted.get("details", {}),
+    }
+    with open(_meta_path(doc_key) + suffix, "w") as f:
+        json.dump(metadata, f)
+    os.replace(_meta_path(doc_key) + suffix, _meta_path(doc_key))
+    return metadata
+
+
+def is_stored(doc_key):
+    return os.path.exists(_meta_path(doc_key))
+
+
+def parse_document(path):
+    # parse a file once per content version and record it in the store;
+    # returns the document metadata
+    doc_key = current_key(path)
+    with _lock:
+        build_lock = _build_locks.setdefault(doc_key, threading.Lock())
+    with build_lock:
+        try:
+            return read_metadata(path, doc_key)
+        except DocumentNotStored:
+            return _write(path, doc_key, extract(path))
+
+
+def read_metadata(path, doc_key=None):
+    # metadata of the file's current content and parser version, or of
+    # doc_key; this never parses, and with doc_key given never opens the
+    # file: a document missing from the store is a miss
+    doc_key = doc_key or current_key(path)
+    try:
+        with open(_meta_path(doc_key)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise DocumentNotStored(path)
+
+
+def iter_pages(path, doc_key=None):
+    metadata = read_metadata(path, doc_key)
+    # sidecars from before parser-versioned keys only carry the content hash
+    doc_key = metadata.get("key", metadata["hash"])
+    with gzip.open(_store_path(doc_key), "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def text_windows(texts, max_chars=KEYWORD_WINDOW_CHARS):
+    # regroup a stream of page texts into windows of at most max_chars
+    window, size = [], 0
+    for text in texts:
+        for start in range(0, len(text), max_chars):
+            piece = text[start:start + max_chars]
+            if size + len(piece) > max_chars and window:
+                yield "\n".join(window)
+                window, size = [], 0
+            window.append(piece)
+            size += len(piece)
+    if window:
+        yield "\n".join(window)
+
+
+def iter_text_windows(path, max_chars=KEYWORD_WINDOW_CHARS):
+    return text_windows((page["text"] for page in iter_pages(path) if page["text"]), max_chars)
+
+
+def window_count(path, max_chars=KEYWORD_WINDOW_CHARS):
+    return -(-read_metadata(path)["chars"] // max_chars)
+
+
+def document_chunks(path, doc_key=None):
+    from langchain_core.documents import Document
+
+    source = os.path.abspath(path)
+    return [
+        Document(page_content=page["text"][start:end], metadata={"source": source, "page": page["page"]})
+        for page in iter_pages(path, doc_key)
+        for start, end in page["chunks"]
+    ]
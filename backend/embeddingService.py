@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import OllamaEmbeddings
+
+from Redis_Client import key as redis_key, redis_client
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "gemma:2b")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+EMBEDDING_LRU_SIZE = int(os.getenv("EMBEDDING_LRU_SIZE", "10000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(30 * 24 * 3600)))
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, inner, model, lru_size=EMBEDDING_LRU_SIZE, batch_size=EMBEDDING_BATCH_SIZE):
+        self.inner = inner
+        self.model = model
+        self.lru_size = lru_size
+        self.batch_size = batch_size
+        self._lru = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "lru_hits": 0,
+            "redis_hits": 0,
+            "coalesced": 0,
+            "misses": 0,
+            "batches": 0,
+            "batched_texts": 0,
+            "max_batch": 0,
+        }
+
+    def _key(self, kind, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return redis_key("embedding", self.model, kind, digest)
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _compute(self, kind, texts):
+        if kind == "query":
+            return [self.inner.embed_query(text) for text in texts]
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            vectors.extend(self.inner.embed_documents(batch))
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["batched_texts"] += len(batch)
+                self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+        return vectors
+
+    def _load(self, kind, owned):
+        keys = list(owned)
+        found = {}
+        try:
+            for key, raw in zip(keys, redis_client.mget(keys)):
+                if raw is not None:
+                    found[key] = json.loads(raw)
+        except Exception as e:
+            print(f"Embedding cache read failed: {e}")
+        missing = [key for key in keys if key not in found]
+        if missing:
+            vectors = self._compute(kind, [owned[key][0] for key in missing])
+            computed = dict(zip(missing, vectors))
+            try:
+                pipe = redis_client.pipeline()
+                for key, vector in computed.items():
+                    pipe.set(key, json.dumps(vector), ex=EMBEDDING_CACHE_TTL)
+                pipe.execute()
+            except Exception as e:
+                print(f"Embedding cache write failed: {e}")
+            found.update(computed)
+        with self._lock:
+            self._stats["redis_hits"] += len(keys) - len(missing)
+            self._stats["misses"] += len(missing)
+            for key, vector in found.items():
+                self._remember(key, vector)
+        return found
+
+    def _embed(self, kind, texts):
+        keys = [self._key(kind, text) for text in texts]
+        results, owned, waiting = {}, {}, {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                self._stats["requests"] += 1
+                if key in results or key in owned or key in waiting:
+                    self._stats["coalesced"] += 1
+                elif key in self._lru:
+                    self._lru.move_to_end(key)
+                    results[key] = self._lru[key]
+                    self._stats["lru_hits"] += 1
+                elif key in self._inflight:
+                    waiting[key] = self._inflight[key]
+                    self._stats["coalesced"] += 1
+                else:
+                    future = Future()
+                    self._inflight[key] = future
+                    owned[key] = (text, future)
+
+        if owned:
+            try:
+                found = self._load(kind, owned)
+                for key, (text, future) in owned.items():
+                    future.set_result(found[key])
+                results.update(found)
+            except Exception as e:
+                for text, future in owned.values():
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    for key in owned:
+                        self._inflight.pop(key, None)
+
+        for key, future in waiting.items():
+            results[key] = future.result()
+        return [results[key] for key in keys]
+
+    def embed_documents(self, texts):
+        return self._embed("document", list(texts))
+
+    def embed_query(self, text):
+        return self._embed("query", [text])[0]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["lru_size"] = len(self._lru)
+        hits = stats["lru_hits"] + stats["redis_hits"] + stats["coalesced"]
+        stats["hit_rate"] = hits / stats["requests"] if stats["requests"] else 0.0
+        stats["avg_batch"] = stats["batched_texts"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+
+embeddings = CachedEmbeddings(OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=OLLAMA_BASE_URL), EMBEDDING_MODEL)
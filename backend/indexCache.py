@@ -0,0 +1,97 @@
+import os
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+
+import faiss
+from langchain_community.vectorstores import FAISS
+
+from documentStore import DOCUMENT_STORE_VERSION, current_key, document_chunks
+
+INDEX_CACHE_DIR = os.getenv(
+    "INDEX_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "faiss"),
+)
+MAX_LOADED_INDEXES = int(os.getenv("MAX_LOADED_INDEXES", "64"))
+
+_loaded = OrderedDict()
+_lock = threading.Lock()
+_build_locks = {}
+_path_keys = {}
+
+
+def _index_key(doc_key, embeddings):
+    model = getattr(embeddings, "model", "default").replace("/", "_").replace(":", "_")
+    return f"{doc_key}-{model}-v{DOCUMENT_STORE_VERSION}"
+
+
+def _read_index(folder, embeddings):
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    # newer faiss can also map flat (non-IVF) codes instead of copying them in
+    flags |= getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    index = faiss.read_index(os.path.join(folder, "index.faiss"), flags)
+    with open(os.path.join(folder, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def _build_index(file_path, folder, embeddings, doc_key):
+    docs = document_chunks(file_path, doc_key)
+    db = FAISS.from_documents(docs, embeddings)
+    tmp_folder = f"{folder}.tmp-{os.getpid()}-{threading.get_ident()}"
+    db.save_local(tmp_folder)
+    os.replace(tmp_folder, folder)
+
+
+def _remember(key, db):
+    with _lock:
+        _loaded[key] = db
+        _loaded.move_to_end(key)
+        while len(_loaded) > MAX_LOADED_INDEXES:
+            _loaded.popitem(last=False)
+
+
+def _drop_stale(path, key):
+    # the same path used to point at different content; forget its old index
+    # unless another cached path still has that content
+    with _lock:
+        old_key = _path_keys.get(path)
+        _path_keys[path] = key
+        if old_key is None or old_key == key or old_key in _path_keys.values():
+            return
+        _loaded.pop(old_key, None)
+    shutil.rmtree(os.path.join(INDEX_CACHE_DIR, old_key), ignore_errors=True)
+
+
+def get_file_index(file_path, embeddings, doc_key=None):
+    # callers that know the document key (Redis record, corpus state) pass it,
+    # so neither the file nor its hash has to be read
+    path = os.path.abspath(file_path)
+    doc_key = doc_key or current_key(path)
+    key = _index_key(doc_key, embeddings)
+    _drop_stale(path, key)
+
+    with _lock:
+        db = _loaded.get(key)
+        if db is not None:
+            _loaded.move_to_end(key)
+            return db
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+
+    with build_lock:
+        with _lock:
+            db = _loaded.get(key)
+        if db is not None:
+            return db
+        folder = os.path.join(INDEX_CACHE_DIR, key)
+        if not os.path.exists(os.path.join(folder, "index.faiss")):
+            print(f"Building vector index for {path}")
+            os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+            _build_index(path, folder, embeddings, doc_key)
+        db = _read_index(folder, embeddings)
+        _remember(key, db)
+
+    with _lock:
+        _build_locks.pop(key, None)
+    return db
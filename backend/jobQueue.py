@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "100"))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+
+def _public(job):
+    return {key: value for key, value in job.items() if not key.startswith("_")}
+
+
+def _prune():
+    finished = [job_id for job_id, job in _jobs.items() if job["finished_at"] is not None]
+    for job_id in finished[:max(0, len(_jobs) - JOB_HISTORY)]:
+        _jobs.pop(job_id, None)
+
+
+def _run(job, fn, args):
+    cancel_event = job["_cancel"]
+    if cancel_event.is_set():
+        return
+    job.update(status="running", started_at=time.time())
+
+    def progress(state):
+        job["progress"] = state
+
+    try:
+        result = fn(*args, progress=progress, cancel_event=cancel_event)
+        job["result"] = result
+        job["status"] = "cancelled" if cancel_event.is_set() else "completed"
+    except Exception as e:
+        traceback.print_exc()
+        job.update(status="failed", error=str(e))
+    finally:
+        job["finished_at"] = time.time()
+
+
+def submit(kind, fn, *args):
+    job = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "queued",
+        "progress": None,
+        "result": None,
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "_cancel": threading.Event(),
+    }
+    with _lock:
+        _jobs[job["id"]] = job
+        _prune()
+    _executor.submit(_run, job, fn, args)
+    return _public(job)
+
+
+def get_job(job_id):
+    job = _jobs.get(job_id)
+    return _public(job) if job else None
+
+
+def cancel_job(job_id):
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+    job["_cancel"].set()
+    if job["status"] == "queued":
+        job.update(status="cancelled", finished_at=time.time())
+    elif job["status"] == "running":
+        job["status"] = "cancelling"
+    return _public(job)
@@ -0,0 +1,187 @@
+import ast
+import os
+import threading
+
+import numpy as np
+
+from documentRecords import VECTOR_DTYPE, iter_vectors, last_change, read_changes, read_records, unpack_vector
+
+KEYWORD_TOP_K = int(os.getenv("KEYWORD_TOP_K", "10"))
+KEYWORD_MIN_SIMILARITY = float(os.getenv("KEYWORD_MIN_SIMILARITY", "0.8"))
+# in-memory matrix precision: float32, float16 (half the RAM) or int8 (a quarter);
+# quantized scores only pick candidates, which are re-ranked from the float32 records
+KEYWORD_MATRIX_DTYPE = os.getenv("KEYWORD_MATRIX_DTYPE", "float32")
+KEYWORD_RERANK = int(os.getenv("KEYWORD_RERANK", "4"))
+SCORE_BLOCK_ROWS = 65536
+# more changed records than this since the last query reload the whole matrix
+KEYWORD_DELTA_LIMIT = int(os.getenv("KEYWORD_DELTA_LIMIT", "1000"))
+
+_lock = threading.Lock()
+# rows[path] is that path's row; matrix has spare rows past count for appends
+_state = {"cursor": None, "dim": None, "paths": [], "rows": {}, "matrix": None, "count": 0}
+
+
+def parse_keywords(reply):
+    if not reply:
+        return []
+    start, end = reply.find("["), reply.rfind("]")
+    if start != -1 and end > start:
+        try:
+            parsed = ast.literal_eval(reply[start:end + 1])
+            if isinstance(parsed, (list, tuple)):
+                return [str(k).strip() for k in parsed if str(k).strip()]
+        except (ValueError, SyntaxError):
+            pass
+        reply = reply[start + 1:end]
+    keywords = [k.strip().strip("'\"").strip() for k in reply.split(",")]
+    return [k for k in keywords if k]
+
+
+def keyword_text(keywords):
+    return ", ".join(keywords)
+
+
+def embed_keywords(keywords, embeddings):
+    return embeddings.embed_query(keyword_text(keywords))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _stack(vectors, dim):
+    # one copy from the packed Redis values into a contiguous matrix; vectors
+    # from an older embedding model (other dimension) are left out until
+    # ingestion re-embeds them
+    size = dim * np.dtype(VECTOR_DTYPE).itemsize
+    vectors = [(path, raw) for path, raw in vectors if len(raw) == size]
+    matrix = np.empty((len(vectors), dim), dtype=VECTOR_DTYPE)
+    for row, (_, raw) in enumerate(vectors):
+        matrix[row] = unpack_vector(raw)
+    return [path for path, _ in vectors], _encode(matrix)
+
+
+def _encode(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return _quantize(matrix)
+
+
+def _quantize(matrix):
+    # rows are unit length, so every component fits [-1, 1]
+    if KEYWORD_MATRIX_DTYPE == "float16":
+        return matrix.astype(np.float16)
+    if KEYWORD_MATRIX_DTYPE == "int8":
+        return np.round(matrix * 127).astype(np.int8)
+    return matrix
+
+
+def _scores(matrix, query):
+    if matrix.dtype == np.float32:
+        return matrix @ query
+    # dequantize block by block so the float32 copy never covers the whole matrix
+    scale = 1 / 127 if matrix.dtype == np.int8 else 1.0
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+        block = matrix[start:start + SCORE_BLOCK_ROWS]
+        scores[start:start + len(block)] = (block.astype(np.float32) @ query) * scale
+    return scores
+
+
+def _rerank(paths, query):
+    # exact cosine scores from the full-precision vectors kept in the records
+    records = read_records(paths, ("vector",))
+    exact = {}
+    for path, record in zip(paths, records):
+        if record and len(record["vector"]) == len(query):
+            exact[path] = float(_normalize(record["vector"]) @ query)
+    return exact
+
+
+def _load_matrix(dim):
+    # full reload; the cursor is taken first so writes during the scan are
+    # applied again by the next _refresh, which is harmless
+    cursor = last_change()
+    paths, matrix = _stack(list(iter_vectors()), dim)
+    _state.update(
+        cursor=cursor, dim=dim, paths=paths, rows={path: row for row, path in enumerate(paths)},
+        matrix=matrix, count=len(paths),
+    )
+
+
+def _drop_row(path):
+    # the last row moves into the freed slot so the live rows stay contiguous
+    row = _state["rows"].pop(path)
+    last = _state["count"] - 1
+    if row != last:
+        moved = _state["paths"][last]
+        _state["matrix"][row] = _state["matrix"][last]
+        _state["paths"][row] = moved
+        _state["rows"][moved] = row
+    _state["paths"].pop()
+    _state["count"] = last
+
+
+def _put_row(path, vector):
+    row = _state["rows"].get(path)
+    if row is None:
+        row = _state["count"]
+        matrix = _state["matrix"]
+        if row == len(matrix):
+            grown = np.empty((max(16, 2 * len(matrix)), matrix.shape[1]), dtype=matrix.dtype)
+            grown[:row] = matrix
+            _state["matrix"] = grown
+        _state["paths"].append(path)
+        _state["rows"][path] = row
+        _state["count"] = row + 1
+    _state["matrix"][row] = _encode(np.array(vector, dtype=np.float32)[None])[0]
+
+
+def _apply(paths):
+    # rewritten records overwrite their row, removed ones drop it, new ones append
+    for path, record in zip(paths, read_records(paths, ("vector",))):
+        vector = record.get("vector") if record else None
+        if vector is not None and len(vector) == _state["dim"]:
+            _put_row(path, vector)
+        elif path in _state["rows"]:
+            _drop_row(path)
+
+
+def _refresh(dim):
+    # caller holds the lock; dim is the current embedding model's, taken from
+    # the query vector. One XRANGE per query, a reload only when the model
+    # changed or the change stream cannot say what moved
+    if _state["matrix"] is None or _state["dim"] != dim:
+        _load_matrix(dim)
+        return
+    changes = read_changes(_state["cursor"], KEYWORD_DELTA_LIMIT)
+    if changes is None:
+        _load_matrix(dim)
+        return
+    cursor, paths = changes
+    if paths:
+        _apply(paths)
+    _state["cursor"] = cursor
+
+
+def search(query_vector, k=KEYWORD_TOP_K, threshold=KEYWORD_MIN_SIMILARITY):
+    query = _normalize(np.asarray(query_vector, dtype=np.float32))
+    # scored under the lock: deltas move rows around in place
+    with _lock:
+        _refresh(len(query))
+        count = _state["count"]
+        if not count:
+            return []
+        matrix = _state["matrix"][:count]
+        scores = _scores(matrix, query)
+        wanted = min(k if matrix.dtype == np.float32 else k * KEYWORD_RERANK, count)
+        top = np.argpartition(-scores, wanted - 1)[:wanted]
+        top = top[np.argsort(-scores[top])]
+        candidates = [(_state["paths"][i], float(scores[i])) for i in top]
+    if matrix.dtype != np.float32:
+        exact = _rerank([path for path, _ in candidates], query)
+        candidates = sorted(((path, exact.get(path, score)) for path, score in candidates), key=lambda item: -item[1])[:k]
+    return [(path, score) for path, score in candidates if score > threshold]
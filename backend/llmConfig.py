@@ -1,9 +1,16 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# the one Groq (OpenAI-compatible) configuration every agent shares; point
+# LLM_BASE_URL at a local mock server to run without the provider
 llm_config = {
-"model": "gemma2-9b-it",
-    "api_key": "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",
-    "base_url": "https://api.groq.com/openai/v1",
-    "temperature": 0.3,
+    "model": os.getenv("LLM_MODEL", "gemma2-9b-it"),
+    "api_key": os.getenv("GROQ_API_KEY"),
+    "base_url": os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1"),
+    "temperature": float(os.getenv("LLM_TEMPERATURE", "0.3")),
 }
 
 def get_llm_config():
-    return llm_config
\ No newline at end of file
+    return llm_config
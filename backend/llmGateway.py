@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError, OpenAI
+
+from requestContext import DeadlineExceeded, RequestCancelled, bounded, check, remaining
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+# provider quotas; 0 disables that limit
+LLM_RPM = int(os.getenv("LLM_RPM", "30"))
+LLM_TPM = int(os.getenv("LLM_TPM", "15000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+# reserved per call for the completion until the real usage is known
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "512"))
+CHARS_PER_TOKEN = 4
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    # refills continuously at rate_per_minute; acquire blocks until there is room
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.available = float(rate_per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.available) / self.rate)
+
+    def take(self, amount):
+        # may go negative: a reply that used more than was reserved is paid back later
+        self.available -= amount
+
+
+class LLMGateway:
+    # The single way out to the chat-completions API: one pooled keep-alive
+    # HTTP client, request and token budgets shared by every agent, retries
+    # with jittered exponential backoff, and identical concurrent prompts
+    # answered by a single upstream call.
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, max_retries=LLM_MAX_RETRIES):
+        self.max_retries = max_retries
+        self._http = httpx.Client(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            timeout=LLM_TIMEOUT,
+        )
+        self._clients = {}
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "upstream": 0, "coalesced": 0, "retries": 0, "failures": 0, "throttled_seconds": 0.0}
+
+    def _client(self, config):
+        client_key = (config.get("base_url"), config.get("api_key"))
+        with self._lock:
+            if client_key not in self._clients:
+                self._clients[client_key] = OpenAI(
+                    base_url=config.get("base_url"),
+                    api_key=config.get("api_key"),
+                    http_client=self._http,
+                    max_retries=0,
+                )
+            return self._clients[client_key]
+
+    def _acquire(self, tokens):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(
+                    self._requests.wait_time(1, now) if self._requests else 0.0,
+                    self._tokens.wait_time(tokens, now) if self._tokens else 0.0,
+                )
+                if wait <= 0:
+                    if self._requests:
+                        self._requests.take(1)
+                    if self._tokens:
+                        self._tokens.take(tokens)
+                    return
+                self._stats["throttled_seconds"] += wait
+            left = remaining()
+            if left is not None and wait > left:
+                raise DeadlineExceeded("rate limit wait exceeds the request deadline")
+            time.sleep(wait)
+
+    def _settle(self, reserved, used):
+        if self._tokens and used is not None:
+            with self._lock:
+                self._tokens.take(used - reserved)
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        if isinstance(error, APIStatusError):
+            retry_after = error.response.headers.get("retry-after")
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+        left = remaining()
+        if left is not None and delay > left:
+            raise DeadlineExceeded("retry backoff exceeds the request deadline")
+        with self._lock:
+            self._stats["retries"] += 1
+        time.sleep(delay)
+
+    def _retryable(self, error):
+        if isinstance(error, (APIConnectionError, APITimeoutError)):
+            return True
+        return isinstance(error, APIStatusError) and error.status_code in RETRY_STATUSES
+
+    def _request(self, messages, config, stream):
+        options = {"temperature": config["temperature"]} if "temperature" in config else {}
+        reserved = sum(len(m.get("content") or "") for m in messages) // CHARS_PER_TOKEN + LLM_EXPECTED_OUTPUT_TOKENS
+        for attempt in range(self.max_retries + 1):
+            self._acquire(reserved)
+            # a request with a deadline never waits on the provider past it
+            timeout = bounded(LLM_TIMEOUT)
+            with self._lock:
+                self._stats["upstream"] += 1
+            try:
+                response = self._client(config).chat.completions.create(
+                    model=config["model"], messages=messages, stream=stream, timeout=timeout, **options
+                )
+                return response, reserved
+            except Exception as e:
+                if attempt == self.max_retries or not self._retryable(e):
+                    with self._lock:
+                        self._stats["failures"] += 1
+                    raise
+                self._backoff(attempt, e)
+
+    def _complete(self, messages, config):
+        response, reserved = self._request(messages, config, stream=False)
+        self._settle(reserved, response.usage.total_tokens if response.usage else None)
+        return response.choices[0].message.content
+
+    def chat(self, messages, config):
+        # identical prompts in flight at the same time share one upstream call
+        digest = hashlib.sha256(json.dumps(
+            [config.get("base_url"), config["model"], config.get("temperature"), messages], sort_keys=True
+        ).encode("utf-8")).hexdigest()
+        with self._lock:
+            self._stats["requests"] += 1
+            future = self._inflight.get(digest)
+            owner = future is None
+            if owner:
+                future = self._inflight[digest] = Future()
+            else:
+                self._stats["coalesced"] += 1
+        if not owner:
+            try:
+                return future.result(timeout=bounded(None))
+            except FutureTimeout:
+                raise DeadlineExceeded("request deadline exceeded")
+            except (DeadlineExceeded, RequestCancelled):
+                # the request that owned the shared call gave up; this one still wants the answer
+                check()
+                return self._complete(messages, config)
+        try:
+            future.set_result(self._complete(messages, config))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(digest, None)
+        return future.result()
+
+    def stream_chat(self, messages, config):
+        with self._lock:
+            self._stats["requests"] += 1
+        response, reserved = self._request(messages, config, stream=True)
+        chars = 0
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chars += len(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            # also runs when the consumer stops early, releasing the connection
+            response.close()
+        self._settle(reserved, reserved - LLM_EXPECTED_OUTPUT_TOKENS + chars // CHARS_PER_TOKEN)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        return stats
+
+
+gateway = LLMGateway()
+
+
+if __name__ == "__main__":
+    # run against a throwaway local OpenAI-compatible server: identical prompts
+    # are coalesced, and RPM/TPM pacing and retries show up in the stats
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    calls = {"count": 0}
+
+    class MockHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            calls["count"] += 1
+            if calls["count"] % 5 == 0:
+                self.send_response(429)
+                self.send_header("Retry-After", "0.2")
+                self.end_headers()
+                return
+            time.sleep(0.3)
+            reply = json.dumps({
+                "id": "mock", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "echo: " + body["messages"][-1]["content"]}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = {"model": "mock", "api_key": "mock", "base_url": f"http://127.0.0.1:{server.server_port}/v1"}
+    mock_gateway = LLMGateway(rpm=int(sys.argv[1]) if len(sys.argv) > 1 else 60, tpm=0)
+    prompts = ["same question"] * 8 + [f"question {i}" for i in range(8)]
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        replies = list(pool.map(lambda p: mock_gateway.chat([{"role": "user", "content": p}], config), prompts))
+    print(f"{len(replies)} replies in {time.time() - started:.2f}s, {calls['count']} upstream calls")
+    print(mock_gateway.stats())
+    server.shutdown()
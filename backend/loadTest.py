@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+# Fires N concurrent /getuserquery calls at the server with the LLM and the
+# Ollama embeddings served by a local mock, once per QUERY_WORKERS setting,
+# so throughput can be seen tracking the size of the query executor.
+#
+#   python loadTest.py [concurrent requests] [worker counts...]
+#
+# Needs a running Redis; everything is written under the "loadtest" namespace
+# and removed afterwards.
+LLM_LATENCY = float(os.getenv("LOADTEST_LLM_LATENCY", "0.2"))
+EMBEDDING_DIM = 64
+SERVER_PORT = int(os.getenv("LOADTEST_PORT", "8765"))
+NAMESPACE = "loadtest"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # /api/embeddings answers like Ollama, anything else like a chat completion
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.endswith("/api/embeddings"):
+            rng = random.Random(hashlib.sha256(body["prompt"].encode("utf-8")).digest())
+            reply = {"embedding": [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)]}
+        else:
+            time.sleep(LLM_LATENCY)
+            reply = {
+                "id": "mock", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "['invoice', 'total', 'amount']"}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+            }
+        reply = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port):
+    # child process: the real app, configured from the environment set by run()
+    import uvicorn
+
+    from server import app
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def run(workers, requests, mock_url):
+    env = dict(
+        os.environ,
+        LLM_BASE_URL=f"{mock_url}/v1",
+        OLLAMA_BASE_URL=mock_url,
+        GROQ_API_KEY="mock",
+        HF_TOKEN=os.getenv("HF_TOKEN", ""),
+        LLM_RPM="0",
+        LLM_TPM="0",
+        QUERY_WORKERS=str(workers),
+        MAX_QUEUED_QUERIES=str(requests),
+        REQUEST_TIMEOUT="600",
+        REDIS_NAMESPACE=NAMESPACE,
+    )
+    child = subprocess.Popen(
+        [sys.executable, __file__, "--serve", str(SERVER_PORT)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{SERVER_PORT}"
+    try:
+        with httpx.Client(timeout=600, limits=httpx.Limits(max_connections=requests)) as client:
+            while True:
+                try:
+                    client.get(base + "/")
+                    break
+                except httpx.TransportError:
+                    if child.poll() is not None:
+                        raise RuntimeError("server exited during startup")
+                    time.sleep(0.2)
+
+            def query(i):
+                # distinct questions so the answer cache never short-circuits a run
+                started = time.perf_counter()
+                response = client.post(base + "/getuserquery", json={"data": f"invoice total {workers}-{i}"})
+                return response.status_code, time.perf_counter() - started
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=requests) as pool:
+                results = list(pool.map(query, range(requests)))
+            seconds = time.perf_counter() - started
+    finally:
+        child.terminate()
+        child.wait()
+    latencies = sorted(latency for status, latency in results if status == 200)
+    failed = len(results) - len(latencies)
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    print(
+        f"QUERY_WORKERS={workers:>3}: {requests} queries in {seconds:6.2f}s  "
+        f"{len(latencies) / seconds:6.2f} q/s  p50 {p50:5.2f}s  p95 {p95:5.2f}s  failed {failed}"
+    )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        serve(int(sys.argv[2]))
+        sys.exit()
+
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    worker_counts = [int(w) for w in sys.argv[2:]] or [1, 2, 4, 8, 16]
+    mock = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+    print(f"{requests} concurrent queries, mock LLM latency {LLM_LATENCY}s per call")
+    try:
+        for workers in worker_counts:
+            run(workers, requests, f"http://127.0.0.1:{mock.server_port}")
+    finally:
+        mock.shutdown()
+        os.environ["REDIS_NAMESPACE"] = NAMESPACE
+        from Redis_Client import delete_batched, scan_keys
+
+        delete_batched(scan_keys("*"))
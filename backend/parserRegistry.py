@@ -0,0 +1,121 @@
+import importlib
+import os
+import threading
+import zipfile
+
+DEFAULT_INSTRUCTION = "Extract document-related keywords from the following text:"
+
+# name -> parser entry; the parser modules (and with them torch, easyocr,
+# openpyxl, google-generativeai, ...) are only imported the first time a file
+# of that type is actually parsed
+PARSERS = {}
+_by_extension = {}
+_modules = {}
+_sniff_memo = {}
+_lock = threading.Lock()
+
+
+def register_parser(name, extensions, module, extract=None, analyze=None, magic=(), instruction=DEFAULT_INSTRUCTION, version=1):
+    # extract(path) -> {"pages": iterable of page texts, "details": dict} for the
+    # document store; analyze(path) -> keyword reply for types that skip it.
+    # magic is a list of (offset, bytes) signatures checked against the file head;
+    # version is recorded with every ingested document and a change re-indexes them.
+    PARSERS[name] = {
+        "name": name,
+        "version": version,
+        "extensions": tuple(extensions),
+        "module": module,
+        "extract": extract,
+        "analyze": analyze,
+        "magic": tuple(magic),
+        "instruction": instruction,
+    }
+    for extension in extensions:
+        _by_extension[extension] = name
+
+
+register_parser("pdf", [".pdf"], "parsers.pdfParsers", extract="extract_pdf", magic=[(0, b"%PDF-")])
+register_parser("docx", [".docx"], "parsers.wordParser", extract="extract_docx")
+register_parser("xlsx", [".xlsx"], "parsers.spreadsheetParser", extract="extract_xlsx")
+register_parser(
+    "image", [".jpg", ".jpeg", ".png"], "parsers.imageParser", extract="extract_image",
+    magic=[(0, b"\x89PNG\r\n\x1a\n"), (0, b"\xff\xd8\xff")],
+    instruction="Extract company-related keywords from the following text:",
+)
+# ISO-BMFF is shared with audio (M4A), photos (HEIC, AVIF), 3GP and QuickTime,
+# so the major brand after "ftyp" has to be an MP4 video one
+register_parser(
+    "video", [".mp4"], "agents.videoAgent", analyze="analysis_video",
+    magic=[(4, b"ftyp" + brand) for brand in (b"isom", b"iso2", b"mp41", b"mp42", b"avc1")],
+)
+
+
+def _load(module):
+    if module not in _modules:
+        with _lock:
+            if module not in _modules:
+                _modules[module] = importlib.import_module(module)
+    return _modules[module]
+
+
+def _sniff(path):
+    # content-based detection for files with a missing or misleading extension;
+    # OOXML files are zips, told apart by their top-level folder
+    try:
+        with open(path, "rb") as f:
+            head = f.read(16)
+    except OSError:
+        return None
+    for parser in PARSERS.values():
+        if any(head[offset:offset + len(signature)] == signature for offset, signature in parser["magic"]):
+            return parser["name"]
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = archive.namelist()
+        except (OSError, zipfile.BadZipFile):
+            return None
+        if any(name.startswith("word/") for name in names):
+            return "docx"
+        if any(name.startswith("xl/") for name in names):
+            return "xlsx"
+    return None
+
+
+def parser_for(path):
+    # the file head wins over the extension; deleted files fall back to the extension
+    path = os.path.abspath(path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        name = _by_extension.get(os.path.splitext(path)[1].lower())
+        return PARSERS[name] if name else None
+    memo = _sniff_memo.get(path)
+    if memo is None or memo[0] != mtime:
+        memo = (mtime, _sniff(path) or _by_extension.get(os.path.splitext(path)[1].lower()))
+        _sniff_memo[path] = memo
+    return PARSERS[memo[1]] if memo[1] else None
+
+
+def has_parser(path):
+    return parser_for(path) is not None
+
+
+def can_extract(path):
+    parser = parser_for(path)
+    return parser is not None and parser["extract"] is not None
+
+
+def extract(path):
+    parser = parser_for(path)
+    return getattr(_load(parser["module"]), parser["extract"])(path)
+
+
+def analyze(path):
+    parser = parser_for(path)
+    return getattr(_load(parser["module"]), parser["analyze"])(path)
+
+
+def instruction(path):
+    parser = parser_for(path)
+    return parser["instruction"] if parser else DEFAULT_INSTRUCTION
@@ -1,37 +1,133 @@
-import easyocr
-import re
-from autogen import AssistantAgent, UserProxyAgent
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
-from agents.keyWordAgent import keyword_extractor_agent,user_proxy
+import hashlib
+import multiprocessing
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import easyocr
+import numpy as np
+from agents.keyWordAgent import extract_keywords
+from Redis_Client import key, redis_client
 from dotenv import load_dotenv
-from agents.userAgent import promptingAgent,getDetailsAgent
 
 load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-llm_config = {
-"model": "gemma2-9b-it",
-    "api_key": GROQ_API_KEY,
-    "base_url": "https://api.groq.com/openai/v1",
-    "temperature": 0.3,
-}
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "en").split(",")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", str(30 * 24 * 3600)))
+
+_reader = None
+_reader_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_reader():
+    # the detection and recognition models are loaded once per process
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            _reader = easyocr.Reader(OCR_LANGUAGES)
+    return _reader
+
+
+def _decode(image):
+    if isinstance(image, np.ndarray):
+        return image
+    return cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+
+
+def _ocr_local(images):
+    reader = get_reader()
+    decoded = [_decode(image) for image in images]
+    texts = [""] * len(decoded)
+    # readtext_batched stacks its inputs, so batch images of the same size together
+    by_shape = {}
+    for i, image in enumerate(decoded):
+        if image is not None:
+            by_shape.setdefault(image.shape, []).append(i)
+    with _reader_lock:
+        for indexes in by_shape.values():
+            for start in range(0, len(indexes), OCR_BATCH_SIZE):
+                batch = indexes[start:start + OCR_BATCH_SIZE]
+                results = reader.readtext_batched(
+                    [decoded[i] for i in batch], detail=0, batch_size=OCR_BATCH_SIZE
+                )
+                for i, result in zip(batch, results):
+                    texts[i] = ' '.join(result)
+    return texts
+
+
+def _in_worker():
+    # never nest pools: ingestion already calls the parsers from worker processes
+    return multiprocessing.parent_process() is not None
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=get_reader,
+            )
+    return _pool
+
+
+def _cache_key(image):
+    digest = hashlib.sha256()
+    if isinstance(image, np.ndarray):
+        digest.update(str(image.shape).encode())
+        digest.update(np.ascontiguousarray(image).tobytes())
+    else:
+        digest.update(image)
+    return key("ocr", digest.hexdigest())
+
+
+def ocr_images(images, use_pool=None):
+    # images are encoded file bytes or decoded arrays; results are cached by content hash
+    if use_pool is None:
+        use_pool = not _in_worker()
+    keys = [_cache_key(image) for image in images]
+    texts = redis_client.mget(keys) if keys else []
+    missing = [i for i, text in enumerate(texts) if text is None]
+    if missing:
+        if use_pool and OCR_WORKERS > 0:
+            batches = [missing[start:start + OCR_BATCH_SIZE] for start in range(0, len(missing), OCR_BATCH_SIZE)]
+            futures = [get_pool().submit(_ocr_local, [images[i] for i in batch]) for batch in batches]
+            for batch, future in zip(batches, futures):
+                for i, text in zip(batch, future.result()):
+                    texts[i] = text
+        else:
+            for i, text in zip(missing, _ocr_local([images[i] for i in missing])):
+                texts[i] = text
+        pipe = redis_client.pipeline()
+        for i in missing:
+            pipe.set(keys[i], texts[i], ex=OCR_CACHE_TTL)
+        pipe.execute()
+    return texts
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def extract_texts(image_paths, use_pool=None):
+    return ocr_images([_read(path) for path in image_paths], use_pool=use_pool)
+
 
 def extract_text(image_path):
-    reader = easyocr.Reader(['en'])
-    result = reader.readtext(image_path, detail=0)
-    return ' '.join(result)
+    return extract_texts([image_path])[0]
+
+
+def extract_image(image_path):
+    return {"pages": [extract_text(image_path)]}
+
 
 def analysis_image(path):
     text = extract_text(path)
-    user_proxy.send(
-        recipient=keyword_extractor_agent,
-        message=f"""
-        Extract company-related keywords from the following text:
-        \"\"\"{text}\"\"\"
-        """
-        )
-    reply = keyword_extractor_agent.generate_reply(sender=user_proxy)
-    user_proxy.receive(sender=keyword_extractor_agent, message=reply)
-    return reply
\ No newline at end of file
+    return extract_keywords(text, "Extract company-related keywords from the following text:")
@@ -1,41 +1,84 @@
 import os
-from autogen import AssistantAgent, UserProxyAgent
+import time
 from PyPDF2 import PdfReader
-from agents.keyWordAgent import keyword_extractor_agent,user_proxy
+from agents.keyWordAgent import extract_keywords_windowed
+from documentStore import text_windows
 from dotenv import load_dotenv
 
 load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-llm_config = {
-    "model": "gemma2-9b-it",
-    "api_key": GROQ_API_KEY,
-        "base_url": "https://api.groq.com/openai/v1",
-        "temperature": 0.3,
-}
+PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", "200"))
+PDF_PAGE_WINDOW = int(os.getenv("PDF_PAGE_WINDOW", "32"))
 
-def extract_text_from_pdf(pdf_path):
+
+def _ocr_pdf_pages(pdf_path, page_numbers):
+    # rasterize only the requested pages and OCR them in this process
+    import pypdfium2 as pdfium
+    from parsers.imageParser import ocr_images
+
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        images = [pdf[n].render(scale=PDF_OCR_DPI / 72).to_numpy() for n in page_numbers]
+    finally:
+        pdf.close()
+    return ocr_images(images, use_pool=False)
+
+
+def _ocr_pages(pdf_path, page_numbers):
+    from parsers.imageParser import OCR_WORKERS, get_pool, _in_worker
+
+    if _in_worker() or OCR_WORKERS <= 1 or len(page_numbers) == 1:
+        return _ocr_pdf_pages(pdf_path, page_numbers)
+    size = -(-len(page_numbers) // OCR_WORKERS)
+    chunks = [page_numbers[start:start + size] for start in range(0, len(page_numbers), size)]
+    futures = [get_pool().submit(_ocr_pdf_pages, pdf_path, chunk) for chunk in chunks]
+    return [text for future in futures for text in future.result()]
+
+
+def iter_pdf_pages(pdf_path, details=None):
+    # yields (page number, text) lazily, PDF_PAGE_WINDOW pages at a time, so
+    # memory stays flat however long the document is
     reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            text += page_text + "\n"
-    return text
+    total = len(reader.pages)
+    if details is None:
+        details = {}
+    details.setdefault("ocr_pages", [])
+    details.setdefault("ocr_seconds", 0.0)
+    for start in range(0, total, PDF_PAGE_WINDOW):
+        numbers = list(range(start, min(start + PDF_PAGE_WINDOW, total)))
+        texts = [reader.pages[n].extract_text() or "" for n in numbers]
+        # pages without a text layer (scans) take the OCR path, the rest stay cheap
+        blank = [i for i, text in enumerate(texts) if not text.strip()]
+        if blank:
+            started = time.time()
+            try:
+                for i, text in zip(blank, _ocr_pages(pdf_path, [numbers[i] for i in blank])):
+                    texts[i] = text
+            except Exception as e:
+                print(f"OCR fallback failed for {pdf_path}: {e}")
+            details["ocr_pages"].extend(numbers[i] for i in blank)
+            details["ocr_seconds"] = round(details["ocr_seconds"] + time.time() - started, 3)
+        for n, text in zip(numbers, texts):
+            yield n, text
+    if details["ocr_pages"]:
+        print(f"OCR'd {len(details['ocr_pages'])}/{total} pages of {pdf_path} in {details['ocr_seconds']}s")
+
+
+def extract_pdf(pdf_path):
+    # details are complete once the pages generator has been consumed
+    details = {}
+    return {
+        "pages": (text for _, text in iter_pdf_pages(pdf_path, details)),
+        "details": details,
+    }
+
+
+def extract_text_from_pdf(pdf_path):
+    return "".join(text + "\n" for _, text in iter_pdf_pages(pdf_path) if text)
 
 def analyze_pdf(pdf_path):
-    extracted_text = extract_text_from_pdf(pdf_path)
-    user_proxy.send(
-        recipient=keyword_extractor_agent,
-        message=f"""
-Extract document-related keywords from the following text:
-\"\"\"{extracted_text}\"\"\"
-"""
-    )
-    reply = keyword_extractor_agent.generate_reply(sender=user_proxy)
-    user_proxy.receive(sender=keyword_extractor_agent, message=reply)
-
-    return reply
+    pages = (text for _, text in iter_pdf_pages(pdf_path))
+    return extract_keywords_windowed(text_windows(pages))
 if __name__ == "__main__":
     pdf_path = "invoices/SammyMaystoneLinesTest.pdf"
     if not os.path.exists(pdf_path):
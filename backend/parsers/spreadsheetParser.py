@@ -0,0 +1,74 @@
+import os
+from openpyxl import load_workbook
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# rows per stored "page"; every page repeats the sheet name and header row so
+# retrieved chunks still make sense on their own
+SHEET_ROWS_PER_PAGE = int(os.getenv("SHEET_ROWS_PER_PAGE", "200"))
+SHEET_MAX_CELL_CHARS = int(os.getenv("SHEET_MAX_CELL_CHARS", "200"))
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    text = str(value).strip().replace("\n", " ")
+    return text[:SHEET_MAX_CELL_CHARS]
+
+
+def _row_text(cells):
+    # trailing empty cells are dropped so sparse sheets stay compact
+    while cells and not cells[-1]:
+        cells.pop()
+    return " | ".join(cells)
+
+
+def iter_sheet_pages(xlsx_path, details=None):
+    # read-only mode streams rows from the archive instead of building the
+    # whole workbook in memory, so only one page of rows is held at a time
+    if details is None:
+        details = {}
+    details.setdefault("sheets", [])
+    details.setdefault("rows", 0)
+    workbook = load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            header, rows, first, last, count = None, [], 0, 0, 0
+            for number, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+                line = _row_text([_cell(value) for value in values])
+                if not line.strip(" |"):
+                    continue
+                if header is None:
+                    header = line
+                    continue
+                if not rows:
+                    first = number
+                rows.append(line)
+                last = number
+                count += 1
+                if len(rows) >= SHEET_ROWS_PER_PAGE:
+                    yield _page(sheet.title, header, first, number, rows)
+                    rows = []
+            if rows or (header is not None and not count):
+                # blank rows are skipped, so the range ends at the last row kept
+                yield _page(sheet.title, header, first, last, rows)
+            details["sheets"].append({"name": sheet.title, "rows": count})
+            details["rows"] += count
+    finally:
+        workbook.close()
+
+
+def _page(title, header, first, last, rows):
+    lines = [f"Sheet: {title}" + (f" (rows {first}-{last})" if rows else "")]
+    if header:
+        lines.append(f"Columns: {header}")
+    lines.extend(rows)
+    return "\n".join(lines)
+
+
+def extract_xlsx(xlsx_path):
+    # details are complete once the pages generator has been consumed
+    details = {}
+    return {"pages": iter_sheet_pages(xlsx_path, details), "details": details}
+
@@ -1,18 +1,8 @@
-import os
-from autogen import AssistantAgent, UserProxyAgent
 from docx import Document
-from agents.keyWordAgent import keyword_extractor_agent,user_proxy
+from agents.keyWordAgent import extract_keywords
 from dotenv import load_dotenv
 
 load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-
-llm_config = {
-"model": "gemma2-9b-it",
-    "api_key": GROQ_API_KEY,
-    "base_url": "https://api.groq.com/openai/v1",
-    "temperature": 0.3,
-}
 
 def extract_text_from_docx(docx_path):
     doc = Document(docx_path)
@@ -21,15 +11,9 @@ def extract_text_from_docx(docx_path):
         full_text.append(para.text)
     return "\n".join(full_text)
 
+def extract_docx(docx_path):
+    return {"pages": [extract_text_from_docx(docx_path)]}
+
 def analysis_word(docx_path):
     extracted_text = extract_text_from_docx(docx_path)
-    user_proxy.send(
-        recipient=keyword_extractor_agent,
-        message=f"""
-Extract document-related keywords from the following text:
-\"\"\"{extracted_text}\"\"\"
-"""
-    )
-    reply = keyword_extractor_agent.generate_reply(sender=user_proxy)
-    user_proxy.receive(sender=keyword_extractor_agent, message=reply)
-    return reply
+    return extract_keywords(extracted_text)
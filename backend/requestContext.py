@@ -0,0 +1,120 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))
+# queries running at once, and how many more may wait for a slot
+MAX_INFLIGHT_QUERIES = int(os.getenv("MAX_INFLIGHT_QUERIES", os.getenv("QUERY_WORKERS", "8")))
+MAX_QUEUED_QUERIES = int(os.getenv("MAX_QUEUED_QUERIES", str(2 * MAX_INFLIGHT_QUERIES)))
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+_cancelled = contextvars.ContextVar("cancelled", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+def start(timeout=REQUEST_TIMEOUT):
+    # call inside the context the request's work runs in (see server.py);
+    # returns the event that cancels it
+    cancelled = threading.Event()
+    _deadline.set(time.monotonic() + timeout)
+    _cancelled.set(cancelled)
+    return cancelled
+
+
+def remaining():
+    # seconds left before the current request's deadline; None outside a request
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def time_left(context):
+    # remaining() for a copied request context, read from the event loop
+    # while a worker thread is running inside that context
+    deadline = context.get(_deadline)
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check():
+    # called between stages and inside long loops; raises once the request
+    # is past its deadline or its client has gone away
+    cancelled = _cancelled.get()
+    if cancelled is not None and cancelled.is_set():
+        raise RequestCancelled("client disconnected")
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+
+
+def bounded(timeout):
+    # clamp a blocking call's own timeout to what the request has left
+    left = remaining()
+    if left is None:
+        return timeout
+    check()
+    return min(timeout, left) if timeout is not None else left
+
+
+class Overloaded(Exception):
+    def __init__(self, status_code, retry_after, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Admission:
+    # Bounded admission for query requests, used from the event loop. Up to
+    # max_inflight run and up to max_queued wait; beyond that a request is
+    # refused with 429 at once. A request is refused with 503 when the
+    # expected queueing delay (from the recent average service time) already
+    # exceeds its deadline, or when it does not get a slot before it.
+
+    def __init__(self, max_inflight=MAX_INFLIGHT_QUERIES, max_queued=MAX_QUEUED_QUERIES):
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self._slots = None
+        self._waiting = 0
+        self._running = 0
+        self._avg_seconds = 5.0
+        self._stats = {"admitted": 0, "rejected_429": 0, "rejected_503": 0}
+
+    def _retry_after(self):
+        return max(1, round(self._avg_seconds * (self._waiting + 1) / self.max_inflight))
+
+    async def enter(self, timeout=REQUEST_TIMEOUT):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_inflight)
+        if self._running + self._waiting >= self.max_inflight + self.max_queued:
+            self._stats["rejected_429"] += 1
+            raise Overloaded(429, self._retry_after(), "Too many requests, try again later")
+        ahead = self._running + self._waiting - self.max_inflight + 1
+        if ahead > 0 and self._avg_seconds * ahead / self.max_inflight > timeout:
+            self._stats["rejected_503"] += 1
+            raise Overloaded(503, self._retry_after(), "Service overloaded, try again later")
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self._stats["rejected_503"] += 1
+            raise Overloaded(503, self._retry_after(), "Service overloaded, try again later")
+        finally:
+            self._waiting -= 1
+        self._running += 1
+        self._stats["admitted"] += 1
+        return time.monotonic()
+
+    def leave(self, entered):
+        self._running -= 1
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.monotonic() - entered)
+        self._slots.release()
+
+    def stats(self):
+        return dict(self._stats, running=self._running, waiting=self._waiting, avg_seconds=round(self._avg_seconds, 3))
@@ -1,12 +1,183 @@
+import time
+
+# measured from the first import so time-to-ready includes loading the app modules
+STARTED_AT = time.perf_counter()
+
 from fastapi import FastAPI,Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from controllers.getFolderAnalysis.handler import analysisFolder as analyze_folder
-from agents.userAgent import handle_user_query
-from controllers.getFolderAnalysis.handler import get_file_info
+from agents.userAgent import handle_user_query, query_events
+from controllers.getFolderAnalysis.handler import get_file_info, file_info_events
+from embeddingService import embeddings
+from answerCache import answer_cache
+from llmGateway import gateway
+from jobQueue import submit as submit_job, get_job, cancel_job
+from requestContext import REQUEST_TIMEOUT, Admission, DeadlineExceeded, Overloaded, RequestCancelled, start, time_left
 import asyncio
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "8"))
+query_executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="query")
+admission = Admission()
+DISCONNECT_POLL_SECONDS = 0.5
 
 app = FastAPI()
+startup = {"import_seconds": round(time.perf_counter() - STARTED_AT, 3), "ready_seconds": None}
+
+
+@app.on_event("startup")
+def record_startup():
+    startup["ready_seconds"] = round(time.perf_counter() - STARTED_AT, 3)
+    print(f"Server ready in {startup['ready_seconds']}s (imports: {startup['import_seconds']}s)")
+
+
+@app.exception_handler(Overloaded)
+def overloaded_response(request: Request, e: Overloaded):
+    return JSONResponse(
+        status_code=e.status_code,
+        headers={"Retry-After": str(e.retry_after)},
+        content={"status": "error", "message": str(e)},
+    )
+
+
+@app.exception_handler(DeadlineExceeded)
+def deadline_response(request: Request, e: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"status": "error", "message": str(e)})
+
+
+@app.exception_handler(RequestCancelled)
+def cancelled_response(request: Request, e: RequestCancelled):
+    # nobody is listening any more; the status only shows up in the access log
+    return JSONResponse(status_code=499, content={"status": "error", "message": str(e)})
+
+
+def request_timeout(request):
+    # a client may ask for a shorter deadline than the server's, never a longer one
+    try:
+        return max(1.0, min(REQUEST_TIMEOUT, float(request.headers.get("X-Request-Timeout", REQUEST_TIMEOUT))))
+    except ValueError:
+        return REQUEST_TIMEOUT
+
+
+async def admit(request):
+    # the deadline starts before queueing, so time spent waiting for a slot counts;
+    # the copied context carries it (and the cancel flag) into the worker thread
+    timeout = request_timeout(request)
+    context = contextvars.copy_context()
+    cancelled = context.run(start, timeout)
+    entered = await admission.enter(timeout)
+    return context, cancelled, entered
+
+
+def release_when_done(work, entered):
+    # the admission slot is held until the worker thread is really free, even
+    # if the client already got its 504; the outcome is collected so that an
+    # abandoned failure is not reported as never retrieved
+    def release(future):
+        admission.leave(entered)
+        if not future.cancelled():
+            future.exception()
+
+    work.add_done_callback(release)
+
+
+async def run_in_query_pool(request, fn, *args):
+    # the agent pipelines make blocking LLM/embedding calls; keep them off the event loop
+    context, cancelled, entered = await admit(request)
+    loop = asyncio.get_running_loop()
+    work = loop.run_in_executor(query_executor, context.run, fn, *args)
+    release_when_done(work, entered)
+    while True:
+        timeout = max(0.0, min(DISCONNECT_POLL_SECONDS, time_left(context)))
+        done, _ = await asyncio.wait({work}, timeout=timeout)
+        if done:
+            return work.result()
+        if time_left(context) <= 0:
+            # a call the pipeline cannot bound (an embedding, say) may keep the
+            # worker busy, but the client gets its 504 on time
+            cancelled.set()
+            raise DeadlineExceeded("request deadline exceeded")
+        if not cancelled.is_set() and await request.is_disconnected():
+            # the pipeline raises RequestCancelled at its next check
+            cancelled.set()
+
+
+async def stream_in_query_pool(events, context, cancelled, slot):
+    # advance the pipeline generator one step at a time on the query pool and
+    # forward every stage/token event to the client as a server-sent event.
+    # A client disconnect cancels this generator, and the finally block tells
+    # the pipeline to stop instead of running on for nobody.
+    slot["started"] = True
+    entered = slot["entered"]
+    loop = asyncio.get_running_loop()
+    finished = object()
+    step = None
+    try:
+        while True:
+            try:
+                step = loop.run_in_executor(query_executor, context.run, next, events, finished)
+                done, _ = await asyncio.wait({step}, timeout=max(0.0, time_left(context)))
+                if not done:
+                    raise DeadlineExceeded("request deadline exceeded")
+                event = step.result()
+            except (DeadlineExceeded, RequestCancelled) as e:
+                event = {"event": "error", "status": 504 if isinstance(e, DeadlineExceeded) else 499, "message": str(e)}
+                yield f"event: error\ndata: {json.dumps(event)}\n\n"
+                break
+            except Exception as e:
+                # the 200 headers are already out; tell the client instead of just closing
+                print(f"Error in query stream: {e!r}")
+                event = {"event": "error", "status": 500, "message": "Internal error while answering the query"}
+                yield f"event: error\ndata: {json.dumps(event)}\n\n"
+                break
+            if event is finished:
+                break
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        cancelled.set()
+        if step is not None and not step.done():
+            release_when_done(step, entered)
+        else:
+            admission.leave(entered)
+
+
+class QueryStream(StreamingResponse):
+    # An admitted query stream that always gives its slot back. Once started,
+    # the body generator releases it in its finally block; but a client that
+    # leaves while the response is starting makes Starlette cancel at the
+    # first send, before the body is ever iterated, and then only this
+    # wrapper is left to do it.
+
+    def __init__(self, events, context, cancelled, entered):
+        self.cancelled = cancelled
+        self.slot = {"entered": entered, "started": False}
+        super().__init__(
+            stream_in_query_pool(events, context, cancelled, self.slot),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # a generator left suspended at a yield runs its finally now,
+            # not whenever it is garbage collected
+            await self.body_iterator.aclose()
+            if not self.slot["started"]:
+                self.cancelled.set()
+                admission.leave(self.slot["entered"])
+
+
+async def sse_response(request, events):
+    # admitted before the response starts, so overload is still a plain 429/503
+    context, cancelled, entered = await admit(request)
+    return QueryStream(events, context, cancelled, entered)
+
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,8 +192,11 @@ app.add_middleware(
             "Content-Type",
             "Access-Control-Allow-Credentials",
             "Access-Control-Allow-Headers",
-            "Access-Control-Allow-Methods"
+            "Access-Control-Allow-Methods",
+            "X-Request-Timeout"
         ],
+    # lets the frontend read how long to back off after a 429/503
+    expose_headers=["Retry-After"],
     allow_credentials=True
 )
 
@@ -30,25 +204,82 @@ app.add_middleware(
 def read_root():
     return {"sucess" : True,"message": "running on port 8000"}
 
+@app.get("/stats/startup")
+def startup_stats():
+    return {"status": "success", "result": startup}
+
+@app.get("/stats/embeddings")
+def embedding_stats():
+    return {"status": "success", "result": embeddings.stats()}
+
+@app.get("/stats/answers")
+def answer_stats():
+    return {"status": "success", "result": answer_cache.stats()}
+
+@app.get("/stats/llm")
+def llm_stats():
+    return {"status": "success", "result": gateway.stats()}
+
+@app.get("/stats/admission")
+def admission_stats():
+    return {"status": "success", "result": admission.stats()}
+
 @app.post("/getuserquery")
 async def getuserquery(request: Request):
     data=await request.json()
     if('feedback' not in data):
         data['feedback'] = 0
-    response= handle_user_query(data)
+    response = await run_in_query_pool(request, handle_user_query, data)
     return JSONResponse(content={"status": "success", "result": "Query processed successfully","response": response})
+
+@app.post("/getuserquery/stream")
+async def getuserquery_stream(request: Request):
+    data = await request.json()
+    if('feedback' not in data):
+        data['feedback'] = 0
+    return await sse_response(request, query_events(data, stream=True))
     
 @app.post("/getfileinfo")
 async def analysisFolder(request: Request):
     data = await request.json()
     print(data['data'])
-    result = analyze_folder(data['data'])
-    return JSONResponse(content={"status": "success", "result": result})
+    job = submit_job("ingestion", analyze_folder, data['data'])
+    return JSONResponse(content={"status": "success", "result": {"job_id": job["id"], "job": job}})
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Job not found"})
+    return JSONResponse(content={"status": "success", "result": job})
+
+
+@app.get("/jobs/{job_id}/progress")
+def job_progress(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Job not found"})
+    return JSONResponse(content={"status": "success", "result": {"status": job["status"], "progress": job["progress"]}})
+
+
+@app.post("/jobs/{job_id}/cancel")
+def job_cancel(job_id: str):
+    job = cancel_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "Job not found"})
+    return JSONResponse(content={"status": "success", "result": job})
 
 
 @app.post("/getspecificfileinfo")
 async def getspecificfileinfo(request: Request):
     data = await request.json()
     print(data)
-    result = get_file_info(data)
-    return JSONResponse(content={"status": "success", "result": result})
\ No newline at end of file
+    result = await run_in_query_pool(request, get_file_info, data)
+    return JSONResponse(content={"status": "success", "result": result})
+
+
+@app.post("/getspecificfileinfo/stream")
+async def getspecificfileinfo_stream(request: Request):
+    data = await request.json()
+    return await sse_response(request, file_info_events(data, stream=True))